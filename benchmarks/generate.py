@@ -0,0 +1,239 @@
+'''Generate synthetic must-gather trees for benchmarking okd-camgi.
+
+usage: python benchmarks/generate.py --nodes 500 --csrs 2000 path/to/output
+'''
+from argparse import ArgumentParser
+import base64
+from datetime import datetime, timedelta, timezone
+import os
+import random
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+import yaml
+
+
+YamlDumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+MACHINE_API_NAMESPACE = 'openshift-machine-api'
+MCO_NAMESPACE = 'openshift-machine-config-operator'
+START_TIME = datetime(2021, 6, 1, tzinfo=timezone.utc)
+
+
+def timestamp(offset):
+    return (START_TIME + timedelta(seconds=offset)).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def managed_fields(manager):
+    return [{
+        'apiVersion': 'v1',
+        'fieldsType': 'FieldsV1',
+        'fieldsV1': {
+            'f:metadata': {'f:annotations': {'.': {}}, 'f:labels': {'.': {}}},
+            'f:status': {'f:conditions': {'.': {}}, 'f:capacity': {'.': {}}},
+        },
+        'manager': manager,
+        'operation': 'Update',
+        'time': timestamp(0),
+    }]
+
+
+def write_manifest(path, manifest):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as manifest_file:
+        yaml.dump(manifest, manifest_file, Dumper=YamlDumper, default_flow_style=False)
+
+
+def node(name, ready):
+    return {
+        'apiVersion': 'v1',
+        'kind': 'Node',
+        'metadata': {
+            'annotations': {'machine.openshift.io/machine': f'{MACHINE_API_NAMESPACE}/{name}'},
+            'creationTimestamp': timestamp(0),
+            'labels': {
+                'kubernetes.io/hostname': name,
+                'node-role.kubernetes.io/worker': '',
+                'node.kubernetes.io/instance-type': 'm5.xlarge',
+            },
+            'managedFields': managed_fields('kubelet'),
+            'name': name,
+            'uid': f'{name}-uid',
+        },
+        'spec': {'providerID': f'aws:///us-east-1a/i-{name}'},
+        'status': {
+            'addresses': [{'address': '10.0.0.1', 'type': 'InternalIP'}, {'address': name, 'type': 'Hostname'}],
+            'allocatable': {'cpu': '3500m', 'ephemeral-storage': '115470533646', 'memory': '15225364Ki', 'pods': '250'},
+            'capacity': {'cpu': '4', 'ephemeral-storage': '125293548Ki', 'memory': '16376340Ki', 'pods': '250'},
+            'conditions': [
+                {'lastHeartbeatTime': timestamp(60), 'lastTransitionTime': timestamp(0), 'message': 'kubelet has sufficient memory available',
+                 'reason': 'KubeletHasSufficientMemory', 'status': 'False', 'type': 'MemoryPressure'},
+                {'lastHeartbeatTime': timestamp(60), 'lastTransitionTime': timestamp(0), 'message': 'kubelet is posting ready status',
+                 'reason': 'KubeletReady', 'status': 'True' if ready else 'False', 'type': 'Ready'},
+            ],
+            'images': [{'names': [f'quay.io/openshift/image-{i}@sha256:{i:064x}'], 'sizeBytes': 100000000 + i} for i in range(20)],
+            'nodeInfo': {'kubeletVersion': 'v1.21.1', 'operatingSystem': 'linux', 'architecture': 'amd64'},
+        },
+    }
+
+
+def machine(name, machineset, phase):
+    return {
+        'apiVersion': 'machine.openshift.io/v1beta1',
+        'kind': 'Machine',
+        'metadata': {
+            'creationTimestamp': timestamp(0),
+            'labels': {'machine.openshift.io/cluster-api-machineset': machineset},
+            'managedFields': managed_fields('machine-controller'),
+            'name': name,
+            'namespace': MACHINE_API_NAMESPACE,
+        },
+        'spec': {'providerSpec': {'value': {'instanceType': 'm5.xlarge', 'placement': {'region': 'us-east-1', 'availabilityZone': 'us-east-1a'}}}},
+        'status': {'nodeRef': {'kind': 'Node', 'name': name}, 'phase': phase},
+    }
+
+
+def machineset(name, replicas, autoscaling):
+    annotations = {}
+    if autoscaling:
+        annotations = {
+            'machine.openshift.io/cluster-api-autoscaler-node-group-min-size': '1',
+            'machine.openshift.io/cluster-api-autoscaler-node-group-max-size': str(replicas * 2),
+        }
+    return {
+        'apiVersion': 'machine.openshift.io/v1beta1',
+        'kind': 'MachineSet',
+        'metadata': {'annotations': annotations, 'name': name, 'namespace': MACHINE_API_NAMESPACE},
+        'spec': {'replicas': replicas, 'selector': {'matchLabels': {'machine.openshift.io/cluster-api-machineset': name}}},
+        'status': {'availableReplicas': replicas, 'readyReplicas': replicas, 'replicas': replicas},
+    }
+
+
+def csr_request(key, name):
+    builder = x509.CertificateSigningRequestBuilder().subject_name(x509.Name([
+        x509.NameAttribute(NameOID.COMMON_NAME, f'system:node:{name}'),
+        x509.NameAttribute(NameOID.ORGANIZATION_NAME, 'system:nodes'),
+    ])).add_extension(x509.SubjectAlternativeName([x509.DNSName(name)]), critical=False)
+    csr = builder.sign(key, hashes.SHA256())
+    return base64.b64encode(csr.public_bytes(serialization.Encoding.PEM)).decode()
+
+
+def csr(name, request, state):
+    status = {}
+    if state == 'approved':
+        status = {'certificate': base64.b64encode(b'certificate').decode(), 'conditions': [{'type': 'Approved', 'reason': 'NodeCSRApprove'}]}
+    elif state == 'denied':
+        status = {'conditions': [{'type': 'Denied', 'reason': 'CSRDenied'}]}
+    return {
+        'apiVersion': 'certificates.k8s.io/v1',
+        'kind': 'CertificateSigningRequest',
+        'metadata': {'creationTimestamp': timestamp(0), 'name': name},
+        'spec': {'request': request, 'signerName': 'kubernetes.io/kubelet-serving', 'usages': ['digital signature', 'key encipherment', 'server auth']},
+        'status': status,
+    }
+
+
+def pod(name, namespace, containers):
+    return {
+        'apiVersion': 'v1',
+        'kind': 'Pod',
+        'metadata': {'managedFields': managed_fields('kube-controller-manager'), 'name': name, 'namespace': namespace},
+        'spec': {'containers': [{'name': c, 'image': f'quay.io/openshift/{c}:latest'} for c in containers]},
+        'status': {'phase': 'Running', 'containerStatuses': [{'name': c, 'ready': True, 'restartCount': 0} for c in containers]},
+    }
+
+
+def write_log(path, lines, rand):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    messages = (
+        'scale_up.go:{}] Scale-up: setting group {} size to {}',
+        'static_autoscaler.go:{}] Starting main loop for group {} target {}',
+        'scale_down.go:{}] Scale-down: removing empty node {} from group {}',
+        'controller.go:{}] {}: reconciling Machine, replicas {}',
+    )
+    with open(path, 'w') as log:
+        for i in range(lines):
+            ts = START_TIME + timedelta(milliseconds=i * 250)
+            message = rand.choice(messages).format(rand.randint(1, 999), f'machineset-{rand.randint(0, 9)}', rand.randint(0, 20))
+            log.write(f'I{ts:%m%d %H:%M:%S}.{ts.microsecond:06d}       1 {message}\n')
+
+
+def generate_must_gather(path, nodes=100, machinesets=10, csrs=200, pods=10, log_lines=10000, seed=0):
+    '''write a synthetic must-gather to path, returns the path of the must-gather root'''
+    rand = random.Random(seed)
+    root = os.path.join(path, 'must-gather.local.0000000000000000000')
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, 'version'), 'w') as version:
+        version.write('okd-camgi-benchmark\n')
+
+    cluster = os.path.join(root, 'cluster-scoped-resources')
+    mapi = os.path.join(root, 'namespaces', MACHINE_API_NAMESPACE)
+
+    write_manifest(os.path.join(cluster, 'config.openshift.io', 'clusterversions.yaml'), {
+        'apiVersion': 'v1',
+        'kind': 'List',
+        'items': [{'status': {'history': [{'state': 'Completed', 'version': '4.8.0', 'completionTime': timestamp(0)}]}}],
+    })
+    write_manifest(os.path.join(cluster, 'autoscaling.openshift.io', 'clusterautoscalers', 'default.yaml'), {
+        'apiVersion': 'autoscaling.openshift.io/v1',
+        'kind': 'ClusterAutoscaler',
+        'metadata': {'name': 'default'},
+        'spec': {'resourceLimits': {'cores': {'min': 8, 'max': 12800}, 'memory': {'min': 4, 'max': 51200}}},
+    })
+
+    for i in range(machinesets):
+        name = f'machineset-{i}'
+        write_manifest(os.path.join(mapi, 'machine.openshift.io', 'machinesets', f'{name}.yaml'), machineset(name, max(1, nodes // max(1, machinesets)), i % 2 == 0))
+        if i % 2 == 0:
+            write_manifest(os.path.join(mapi, 'autoscaling.openshift.io', 'machineautoscalers', f'{name}.yaml'), {
+                'apiVersion': 'autoscaling.openshift.io/v1beta1',
+                'kind': 'MachineAutoscaler',
+                'metadata': {'name': name, 'namespace': MACHINE_API_NAMESPACE},
+                'spec': {'minReplicas': 1, 'maxReplicas': 10, 'scaleTargetRef': {'apiVersion': 'machine.openshift.io/v1beta1', 'kind': 'MachineSet', 'name': name}},
+            })
+
+    for i in range(nodes):
+        name = f'worker-{i}'
+        write_manifest(os.path.join(cluster, 'core', 'nodes', f'{name}.yaml'), node(name, rand.random() > 0.05))
+        phase = 'Running' if rand.random() > 0.05 else 'Provisioned'
+        write_manifest(os.path.join(mapi, 'machine.openshift.io', 'machines', f'{name}.yaml'), machine(name, f'machineset-{i % max(1, machinesets)}', phase))
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    # approved and re-issued csrs often repeat the same request, only a portion are unique
+    requests = [csr_request(key, f'worker-{i}') for i in range(max(1, min(csrs, nodes)))]
+    for i in range(csrs):
+        state = rand.choices(('approved', 'pending', 'denied'), weights=(90, 8, 2))[0]
+        write_manifest(os.path.join(cluster, 'certificates.k8s.io', 'certificatesigningrequests', f'csr-{i:06d}.yaml'),
+                       csr(f'csr-{i:06d}', requests[i % len(requests)], state))
+
+    for namespace, prefix in ((MACHINE_API_NAMESPACE, 'machine-api'), (MCO_NAMESPACE, 'machine-config')):
+        for i in range(pods):
+            name = f'{prefix}-pod-{i}'
+            containers = ['controller', 'kube-rbac-proxy']
+            pod_path = os.path.join(root, 'namespaces', namespace, 'pods', name)
+            write_manifest(os.path.join(pod_path, f'{name}.yaml'), pod(name, namespace, containers))
+            for container in containers:
+                write_log(os.path.join(pod_path, container, container, 'logs', 'current.log'), log_lines, rand)
+
+    return root
+
+
+def main():
+    parser = ArgumentParser(description='generate a synthetic must-gather for benchmarking')
+    parser.add_argument('path', help='directory to write the must-gather into')
+    parser.add_argument('--nodes', type=int, default=100, help='number of nodes, and machines')
+    parser.add_argument('--machinesets', type=int, default=10, help='number of machinesets')
+    parser.add_argument('--csrs', type=int, default=200, help='number of certificate signing requests')
+    parser.add_argument('--pods', type=int, default=10, help='number of pods in each of the machine api and machine config namespaces')
+    parser.add_argument('--log-lines', type=int, default=10000, help='number of lines in each container log')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    args = parser.parse_args()
+
+    root = generate_must_gather(args.path, nodes=args.nodes, machinesets=args.machinesets, csrs=args.csrs,
+                                pods=args.pods, log_lines=args.log_lines, seed=args.seed)
+    print(root)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+'''Time each stage of processing a must-gather with okd-camgi.
+
+usage: python benchmarks/run.py --generate --nodes 1000 --output results.json
+       python benchmarks/run.py --path path/to/must-gather --baseline results.json
+'''
+from argparse import ArgumentParser
+import json
+import os
+import platform
+import resource
+from tempfile import TemporaryDirectory
+import time
+
+import okd_camgi
+from okd_camgi import contexts
+from okd_camgi.interfaces import MustGather
+from okd_camgi.main import find_must_gather_root
+from okd_camgi.rendering import render_index
+
+from generate import generate_must_gather
+
+
+class Stages:
+    '''records the wall time, cpu time and peak rss of each stage'''
+    def __init__(self):
+        self.results = {}
+
+    def run(self, name, func, *args, **kwargs):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        result = func(*args, **kwargs)
+        self.results[name] = {
+            'wall_seconds': time.perf_counter() - wall,
+            'cpu_seconds': time.process_time() - cpu,
+            # ru_maxrss is in kilobytes on linux
+            'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        }
+        return result
+
+
+def load(mustgather):
+    '''read every resource the index uses, returns the raw csr requests'''
+    for attr in ('clusterautoscalers', 'machineautoscalers', 'machinesets', 'machines', 'nodes', 'csrs', 'clusterversion'):
+        getattr(mustgather, attr)
+    mustgather.pods('openshift-machine-api')
+    mustgather.pods('openshift-machine-config-operator')
+    return [csr.request for csr in mustgather.csrs if csr.request]
+
+
+def decode_csrs(requests, mustgather):
+    contexts.csr_decoder.decode_all(requests, mustgather.map)
+
+
+def highlight_all(index_context):
+    for accordion in index_context['accordiondata']:
+        for item in accordion['iterable']:
+            item.yaml_highlight_content
+    for pod in index_context['mapipods'] + index_context['mcopods']:
+        pod.yaml_highlight_content
+
+
+def write(content, path):
+    with open(path, 'w') as indexfile:
+        indexfile.write(content)
+
+
+def run_once(path, jobs, log_tail_lines, outdir):
+    # start each run with empty highlighting and csr caches
+    contexts.highlighter = contexts.YamlHighlighter()
+    contexts.csr_decoder = contexts.CSRDecoder()
+    stages = Stages()
+    root = stages.run('discovery', find_must_gather_root, path)
+    mustgather = MustGather(root, jobs=jobs)
+    requests = stages.run('loading', load, mustgather)
+    stages.run('csr_decoding', decode_csrs, requests, mustgather)
+    index_context = stages.run('index_context', contexts.IndexContext, mustgather, log_tail_lines=log_tail_lines)
+    stages.run('highlighting', highlight_all, index_context)
+    content = stages.run('render', render_index, index_context)
+    stages.run('write', write, content, os.path.join(outdir, 'index.html'))
+    mustgather.close()
+    return stages.results
+
+
+def compare(baseline, results):
+    print(f'{"stage":<16}{"baseline":>12}{"current":>12}{"change":>10}')
+    for stage, current in results['stages'].items():
+        before = baseline.get('stages', {}).get(stage)
+        if before is None:
+            print(f'{stage:<16}{"":>12}{current["wall_seconds"]:>12.3f}')
+            continue
+        change = (current['wall_seconds'] - before['wall_seconds']) / before['wall_seconds'] * 100 if before['wall_seconds'] else 0
+        print(f'{stage:<16}{before["wall_seconds"]:>12.3f}{current["wall_seconds"]:>12.3f}{change:>9.1f}%')
+
+
+def main():
+    parser = ArgumentParser(description='benchmark the stages of processing a must-gather')
+    parser.add_argument('--path', help='path to an existing must-gather')
+    parser.add_argument('--generate', action='store_true', help='generate a synthetic must-gather to benchmark')
+    parser.add_argument('--nodes', type=int, default=100, help='number of nodes, and machines, to generate')
+    parser.add_argument('--machinesets', type=int, default=10, help='number of machinesets to generate')
+    parser.add_argument('--csrs', type=int, default=200, help='number of certificate signing requests to generate')
+    parser.add_argument('--pods', type=int, default=10, help='number of pods to generate in each namespace')
+    parser.add_argument('--log-lines', type=int, default=10000, help='number of lines to generate in each container log')
+    parser.add_argument('--jobs', type=int, default=1, help='number of worker processes to load manifests with')
+    parser.add_argument('--log-tail-lines', type=int, default=5000, help='number of log lines to include in the page')
+    parser.add_argument('--repeat', type=int, default=1, help='number of runs, the fastest time of each stage is reported')
+    parser.add_argument('--output', help='write the results as json to this file')
+    parser.add_argument('--baseline', help='compare the results with a json file from a previous run')
+    args = parser.parse_args()
+
+    if not args.path and not args.generate:
+        parser.error('one of --path or --generate is required')
+
+    parameters = {k: getattr(args, k) for k in ('nodes', 'machinesets', 'csrs', 'pods', 'log_lines')} if args.generate else {'path': args.path}
+    parameters.update({'jobs': args.jobs, 'log_tail_lines': args.log_tail_lines, 'repeat': args.repeat})
+
+    with TemporaryDirectory(prefix='okd_camgi_bench') as workdir:
+        path = args.path
+        if args.generate:
+            path = generate_must_gather(os.path.join(workdir, 'mg'), nodes=args.nodes, machinesets=args.machinesets,
+                                        csrs=args.csrs, pods=args.pods, log_lines=args.log_lines)
+        runs = [run_once(path, args.jobs, args.log_tail_lines, workdir) for _ in range(args.repeat)]
+
+    stages = {}
+    for stage in runs[0]:
+        stages[stage] = {
+            'wall_seconds': min(r[stage]['wall_seconds'] for r in runs),
+            'cpu_seconds': min(r[stage]['cpu_seconds'] for r in runs),
+            'peak_rss_kb': max(r[stage]['peak_rss_kb'] for r in runs),
+        }
+    results = {
+        'okd_camgi_version': okd_camgi.version,
+        'python_version': platform.python_version(),
+        'parameters': parameters,
+        'stages': stages,
+        'total_wall_seconds': sum(s['wall_seconds'] for s in stages.values()),
+    }
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            compare(json.load(baseline_file), results)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+'''Batch triage of many must gathers, with a report for each and a summary of them all.'''
+from argparse import ArgumentParser
+from concurrent.futures import as_completed, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import csv
+import json
+import logging
+import os
+import sys
+
+from okd_camgi.cache import DEFAULT_CACHE_DIR
+
+
+# the suffixes removed from archive names to name their reports
+ARCHIVE_SUFFIXES = ('.tar.gz', '.tgz', '.tar', '.camgi')
+# the columns of the csv summary, lists are written as space separated names
+SUMMARY_COLUMNS = (
+    'path', 'report', 'error', 'clusterversion',
+    'nodes', 'nodes_notready', 'machines', 'machines_notrunning',
+    'machinesets', 'machinesets_participating', 'csrs', 'csrs_pending', 'csrs_denied_or_failed',
+    'max_nodes_total', 'max_cores', 'max_memory',
+    'nodes_notready_names', 'machines_notrunning_names',
+)
+# the lists of the summary that are written as a count, their names are in a column with a _names suffix
+COUNTED_COLUMNS = ('nodes_notready', 'machines_notrunning')
+
+
+def report_name(path, used):
+    '''return a unique name for the report of path, used is the set of names already taken and is updated'''
+    name = os.path.basename(os.path.normpath(path))
+    for suffix in ARCHIVE_SUFFIXES:
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+            break
+    unique = name
+    count = 1
+    while unique in used:
+        count += 1
+        unique = f'{name}-{count}'
+    used.add(unique)
+    return unique
+
+
+def triage(path, report, log_tail_lines=None, cache_dir=None):
+    '''write the report of the must gather at path, and return its summary
+
+    path may be a must gather directory, a tar archive or a compiled file. this is a module
+    level function so that it can be dispatched to a process pool.
+    '''
+    from okd_camgi.main import is_tar_archive, load_index_context, open_must_gather, setup_caches
+    from okd_camgi.rendering import write_index
+
+    mustgather = open_must_gather(path, tar=is_tar_archive(path))
+    if mustgather is None:
+        raise ValueError(f'"{path}" does not appear to be a valid must-gather archive')
+    try:
+        cache = setup_caches(mustgather, cache_dir)
+        index_context = load_index_context(mustgather, cache=cache, log_tail_lines=log_tail_lines)
+        write_index(index_context, report)
+        return index_context.summary()
+    finally:
+        if not isinstance(mustgather, str):
+            mustgather.close()
+
+
+def run_batch(paths, output_dir, jobs=None, log_tail_lines=None, cache_dir=None):
+    '''triage each of the paths in a pool of jobs worker processes, writing the reports to output_dir
+
+    returns a list with a result for each path, in the same order. a result is a dict with the path,
+    the report filename and summary, or the error when the must gather could not be triaged.
+    '''
+    used = set()
+    reports = {path: os.path.join(output_dir, report_name(path, used) + '.html') for path in paths}
+    results = {}
+    lost = []
+
+    def done(path, summary=None, error=None):
+        if error is not None:
+            logging.error(f'unable to triage {path}, {error}')
+        else:
+            logging.info(f'wrote {reports[path]}')
+        results[path] = {
+            'path': path,
+            'report': reports[path] if error is None else None,
+            'error': error,
+            'summary': summary,
+        }
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(triage, path, reports[path], log_tail_lines, cache_dir): path for path in paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                done(path, summary=future.result())
+            except BrokenProcessPool:
+                lost.append(path)
+            except Exception as ex:
+                done(path, error=str(ex) or type(ex).__name__)
+
+    # a worker process that dies takes the whole pool with it, so the must gathers that
+    # were lost are run again one at a time, and only the one that killed its worker fails.
+    for path in lost:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            try:
+                done(path, summary=executor.submit(triage, path, reports[path], log_tail_lines, cache_dir).result())
+            except BrokenProcessPool:
+                done(path, error='the worker process exited unexpectedly')
+            except Exception as ex:
+                done(path, error=str(ex) or type(ex).__name__)
+
+    return [results[path] for path in paths]
+
+
+def summary_row(result):
+    '''return the row of the csv summary for a result'''
+    summary = result['summary'] or {}
+    limits = summary.get('autoscaler_limits', {}).get('cluster') or [{}]
+    row = {
+        'path': result['path'],
+        'report': result['report'],
+        'error': result['error'],
+        'max_nodes_total': limits[0].get('maxNodesTotal'),
+        'max_cores': limits[0].get('cores', {}).get('max'),
+        'max_memory': limits[0].get('memory', {}).get('max'),
+    }
+    for column in COUNTED_COLUMNS:
+        names = summary.get(column)
+        row[column] = len(names) if names is not None else None
+        row[f'{column}_names'] = ' '.join(names) if names is not None else None
+    for column in SUMMARY_COLUMNS:
+        if column not in row:
+            value = summary.get(column)
+            row[column] = ' '.join(value) if isinstance(value, list) else value
+    return row
+
+
+def write_summary(results, output_dir):
+    '''write the results as summary.json and summary.csv in output_dir, returns their filenames'''
+    json_path = os.path.join(output_dir, 'summary.json')
+    with open(json_path, 'w') as summaryfile:
+        json.dump(results, summaryfile, indent=2)
+    csv_path = os.path.join(output_dir, 'summary.csv')
+    with open(csv_path, 'w', newline='') as summaryfile:
+        writer = csv.DictWriter(summaryfile, fieldnames=SUMMARY_COLUMNS)
+        writer.writeheader()
+        writer.writerows(summary_row(r) for r in results)
+    return json_path, csv_path
+
+
+def batch_main(argv):
+    parser = ArgumentParser(prog='okd-camgi batch', description='triage many must-gathers, writing a report for each and a summary of them all')
+    parser.add_argument('paths', nargs='+', help='must-gather directories, tar archives or files compiled by okd-camgi index')
+    parser.add_argument('-o', '--output-dir', required=True, help='directory for the reports and summary')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='number of must-gathers to process at once, defaults to the number of cpus')
+    parser.add_argument('--log-tail-lines', type=int, default=5000, help='number of lines to include from the end of each container log, 0 for all lines')
+    parser.add_argument('--cache-dir', help='directory for the parsed manifest and highlighting caches', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--no-cache', action='store_true', help='disable the parsed manifest and highlighting caches')
+    parser.add_argument('--verbose', action='store_true', help='enable verbose logging')
+    args = parser.parse_args(argv)
+
+    if args.verbose:
+        logging.basicConfig(level=logging.DEBUG)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    paths = [os.path.abspath(p) for p in args.paths]
+    results = run_batch(paths, args.output_dir, jobs=max(1, args.jobs or 1), log_tail_lines=args.log_tail_lines,
+                        cache_dir=None if args.no_cache else args.cache_dir)
+    for filename in write_summary(results, args.output_dir):
+        print(filename)
+
+    failed = [r for r in results if r['error'] is not None]
+    if failed:
+        logging.error(f'{len(failed)} of {len(results)} must-gathers could not be triaged')
+        sys.exit(1)
@@ -0,0 +1,128 @@
+'''On-disk caches for data derived from the must gather artifacts.'''
+import hashlib
+import logging
+import os
+import pickle
+from tempfile import NamedTemporaryFile
+from threading import Lock
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'okd-camgi')
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+# bump this when the format of the cached data changes
+CACHE_VERSION = 1
+
+
+class DiskCache:
+    '''Size capped least recently used cache of pickled values on disk
+
+    the values are stored in a namespace directory under path, and the entry mtimes are
+    used to track which entries were least recently used.
+    '''
+    def __init__(self, namespace, path=DEFAULT_CACHE_DIR, max_size=DEFAULT_MAX_SIZE):
+        self.path = path
+        self.max_size = max_size
+        self.namespace = namespace
+        self._lock = Lock()
+        self._size = None
+
+    def get(self, key):
+        '''return the cached value for a key or none if not found'''
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, 'rb') as entry:
+                value = pickle.load(entry)
+        except FileNotFoundError:
+            return None
+        except Exception as ex:
+            logging.debug(f'discarding unreadable cache entry {entry_path}, {str(ex)}')
+            self._remove(entry_path)
+            return None
+        # touch the entry so that it is the most recently used
+        try:
+            os.utime(entry_path)
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, value):
+        '''store a value in the cache, evicting old entries if the cache is too large'''
+        entry_path = self._entry_path(key)
+        try:
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+            with NamedTemporaryFile(dir=os.path.dirname(entry_path), delete=False) as entry:
+                pickle.dump(value, entry, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(entry.name, entry_path)
+            size = os.path.getsize(entry_path)
+        except Exception as ex:
+            logging.debug(f'unable to write cache entry {entry_path}, {str(ex)}')
+            return
+
+        with self._lock:
+            if self._size is None:
+                self._size = sum(s for _, s, _ in self._entries())
+            else:
+                self._size += size
+            if self._size > self.max_size:
+                self._prune()
+
+    def _entries(self):
+        '''return a list of (path, size, mtime) for all entries in the cache'''
+        entries = []
+        namespace_path = os.path.join(self.path, self.namespace)
+        if not os.path.isdir(namespace_path):
+            return entries
+        for bucket in os.scandir(namespace_path):
+            if not bucket.is_dir():
+                continue
+            for entry in os.scandir(bucket.path):
+                if entry.name.endswith('.pickle'):
+                    stat = entry.stat()
+                    entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, self.namespace, key[:2], f'{key}.pickle')
+
+    def _prune(self):
+        # evict the least recently used entries until the cache is at 90% of its maximum size
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        self._size = sum(s for _, s, _ in entries)
+        target = self.max_size * 0.9
+        for entry_path, size, _ in entries:
+            if self._size <= target:
+                break
+            if self._remove(entry_path):
+                self._size -= size
+        logging.debug(f'pruned {self.namespace} cache in {self.path} to {self._size} bytes')
+
+    @staticmethod
+    def _remove(entry_path):
+        try:
+            os.remove(entry_path)
+            return True
+        except OSError:
+            return False
+
+
+class ParseCache(DiskCache):
+    '''Cache of decoded manifests
+
+    entries are keyed by the manifest path, size, mtime and optionally a hash of the
+    contents, so a changed file will never return stale data.
+    '''
+    def __init__(self, path=DEFAULT_CACHE_DIR, max_size=DEFAULT_MAX_SIZE, hash_contents=False):
+        super().__init__('manifests', path, max_size)
+        self.hash_contents = hash_contents
+
+    def key(self, source, size, mtime, read=None):
+        '''return the cache key for a manifest
+
+        source is the full path of the manifest, read is a function returning the manifest
+        bytes which is only called when hashing the contents.
+        '''
+        keydata = f'{CACHE_VERSION}:{source}:{size}:{mtime}'
+        digest = hashlib.sha256(keydata.encode())
+        if self.hash_contents and read is not None:
+            digest.update(hashlib.sha256(read()).digest())
+        return digest.hexdigest()
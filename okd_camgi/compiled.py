@@ -0,0 +1,271 @@
+'''Compiled must gathers, a single file holding everything okd-camgi reads from a must gather.
+
+A compiled must gather is an sqlite database with these tables:
+
+* files, the path, size and mtime of each file that is read from the must gather
+* chunks, the contents of the files in compressed chunks, so that ranges of large logs can be read
+* lines, the offset of the start of each line in the container logs
+* manifests, the parsed manifests as json
+* cache, the highlighted yaml and decoded csrs, as json by namespace and key
+* meta, the format version and a summary of the must gather
+
+The parsed data is stored as json rather than pickle, so that opening a compiled file
+from somebody else can not run code.
+'''
+from array import array
+from contextlib import closing
+from datetime import date, datetime
+from io import BytesIO
+import json
+import logging
+import os
+import sqlite3
+from threading import Lock
+import time
+import zlib
+
+import okd_camgi
+from okd_camgi.storage import IndexedStorage
+
+
+# bump this when the format of the compiled file changes
+FORMAT_VERSION = 1
+# the size of the uncompressed chunks that file contents are stored in
+CHUNK_SIZE = 1024 * 1024
+SCHEMA = '''
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE files (path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER);
+CREATE TABLE chunks (path TEXT, seq INTEGER, data BLOB, PRIMARY KEY (path, seq));
+CREATE TABLE lines (path TEXT PRIMARY KEY, offsets BLOB);
+CREATE TABLE manifests (path TEXT PRIMARY KEY, data TEXT);
+CREATE TABLE cache (namespace TEXT, key TEXT, value TEXT, PRIMARY KEY (namespace, key));
+'''
+SQLITE_HEADER = b'SQLite format 3\x00'
+
+
+def is_compiled(path):
+    '''return true if path is a compiled must gather file'''
+    if not os.path.isfile(path):
+        return False
+    with open(path, 'rb') as compiledfile:
+        if compiledfile.read(len(SQLITE_HEADER)) != SQLITE_HEADER:
+            return False
+    try:
+        with closing(sqlite3.connect(f'file:{path}?mode=ro', uri=True)) as connection:
+            return connection.execute("SELECT value FROM meta WHERE key = 'format'").fetchone() is not None
+    except sqlite3.Error:
+        return False
+
+
+def to_json(value):
+    '''return value as json, the timestamps parsed from yaml are tagged so they are restored by from_json'''
+    def default(obj):
+        if isinstance(obj, datetime):
+            return {'$datetime': obj.isoformat()}
+        if isinstance(obj, date):
+            return {'$date': obj.isoformat()}
+        raise TypeError(f'{type(obj).__name__} can not be stored as json')
+    return json.dumps(value, default=default, separators=(',', ':'))
+
+
+def from_json(text):
+    def object_hook(obj):
+        if len(obj) == 1:
+            if '$datetime' in obj:
+                return datetime.fromisoformat(obj['$datetime'])
+            if '$date' in obj:
+                return date.fromisoformat(obj['$date'])
+        return obj
+    return json.loads(text, object_hook=object_hook)
+
+
+class CompiledCache:
+    '''read only cache of json values from a compiled must gather, for use as the disk cache of the highlighter or csr decoder'''
+    def __init__(self, storage, namespace):
+        self.storage = storage
+        self.namespace = namespace
+
+    def get(self, key):
+        row = self.storage._query('SELECT value FROM cache WHERE namespace = ? AND key = ?', (self.namespace, key))
+        return from_json(row[0]) if row is not None else None
+
+    def put(self, key, value):
+        pass
+
+
+class CompiledStorage(IndexedStorage):
+    '''storage for a compiled must gather file
+
+    the paths in the file are relative to the must gather root. besides the storage methods, a compiled
+    storage gives the parsed manifests, the line offsets of logs, and caches of highlighted yaml and csrs.
+    '''
+    def __init__(self, filename):
+        super().__init__(filename)
+        self._lock = Lock()
+        # the connection is shared by the server threads, the lock serializes its use
+        self._connection = sqlite3.connect(f'file:{filename}?mode=ro', uri=True, check_same_thread=False)
+        try:
+            version = self._query("SELECT value FROM meta WHERE key = 'format'")
+        except sqlite3.Error:
+            version = None
+        if version is None or int(version[0]) != FORMAT_VERSION:
+            self._connection.close()
+            raise ValueError(f'{filename} is not a compiled must-gather in format version {FORMAT_VERSION}')
+
+        for path, size, mtime in self._connection.execute('SELECT path, size, mtime FROM files'):
+            self._index.add_file(path, size, mtime)
+
+    @property
+    def summary(self):
+        '''return the summary of the must gather that was recorded when it was compiled'''
+        row = self._query("SELECT value FROM meta WHERE key = 'summary'")
+        return from_json(row[0]) if row is not None else None
+
+    def open(self, relpath):
+        '''open a file for binary reading'''
+        return BytesIO(self.read_range(relpath))
+
+    def read_text(self, relpath):
+        return self.read_range(relpath).decode('utf-8')
+
+    def read_range(self, relpath, start=0, end=None):
+        '''return the bytes of a file from start up to end, only the chunks holding the range are decompressed'''
+        size, _ = self.stat(relpath)
+        end = size if end is None else min(end, size)
+        if start >= end:
+            return b''
+        rows = self._query_all('SELECT data FROM chunks WHERE path = ? AND seq BETWEEN ? AND ? ORDER BY seq',
+                               (self._fullpath(relpath), start // CHUNK_SIZE, (end - 1) // CHUNK_SIZE))
+        data = b''.join(zlib.decompress(row[0]) for row in rows)
+        offset = (start // CHUNK_SIZE) * CHUNK_SIZE
+        return data[start - offset:end - offset]
+
+    def line_offsets(self, relpath):
+        '''return an array of the offsets of the start of each line of a log, or none if they were not recorded'''
+        row = self._query('SELECT offsets FROM lines WHERE path = ?', (self._fullpath(relpath),))
+        if row is None:
+            return None
+        offsets = array('Q')
+        offsets.frombytes(zlib.decompress(row[0]))
+        return offsets
+
+    def manifest(self, relpath):
+        '''return the parsed manifest at a path, or none if it was not recorded'''
+        row = self._query('SELECT data FROM manifests WHERE path = ?', (self._fullpath(relpath),))
+        if row is None or row[0] is None:
+            return None
+        return from_json(row[0])
+
+    def cache(self, namespace):
+        '''return a CompiledCache of the values stored in a namespace'''
+        return CompiledCache(self, namespace)
+
+    def close(self):
+        self._connection.close()
+
+    def _query(self, sql, parameters=()):
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchone()
+
+    def _query_all(self, sql, parameters=()):
+        with self._lock:
+            return self._connection.execute(sql, parameters).fetchall()
+
+
+class CollectingCache:
+    '''cache that keeps every value put into it, used to collect the highlighted yaml and csrs while compiling'''
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return None
+
+    def put(self, key, value):
+        self.values[key] = value
+
+
+def compile_must_gather(storage, output, jobs=1):
+    '''write the files that okd-camgi reads from a must gather storage, with their parsed and highlighted forms, to output'''
+    # these are only needed when compiling
+    from okd_camgi import contexts
+    from okd_camgi.interfaces import MustGather, WANTED_PATHS
+
+    partial_output = f'{output}.partial'
+    if os.path.exists(partial_output):
+        os.remove(partial_output)
+    connection = sqlite3.connect(partial_output)
+    try:
+        connection.executescript(SCHEMA)
+        relpaths = []
+        for wanted in ('version',) + WANTED_PATHS:
+            for relpath, _, mtime in storage.walk(wanted):
+                logging.debug(f'compiling {storage.describe(relpath)}')
+                _write_file(connection, storage, relpath, mtime)
+                relpaths.append(relpath)
+
+        with MustGather(storage, jobs=jobs) as mustgather:
+            manifest_paths = [p for p in relpaths if p.endswith('.yaml')]
+            for relpath, manifest in zip(manifest_paths, mustgather.load_manifests(manifest_paths)):
+                try:
+                    data = to_json(manifest) if manifest is not None else None
+                except (TypeError, ValueError) as ex:
+                    # the manifest is parsed again when the compiled file is opened
+                    logging.debug(f'not storing the parsed form of {relpath}, {str(ex)}')
+                    data = None
+                connection.execute('INSERT INTO manifests VALUES (?, ?)', (relpath, data))
+
+            # build the page contexts with empty caches, so that all of the highlighted yaml and csrs are collected
+            collected = {'highlight': CollectingCache(), 'csr': CollectingCache()}
+            highlighter, csr_decoder = contexts.highlighter, contexts.csr_decoder
+            contexts.highlighter = contexts.YamlHighlighter(disk_cache=collected['highlight'])
+            contexts.csr_decoder = contexts.CSRDecoder(disk_cache=collected['csr'])
+            try:
+                index_context = contexts.IndexContext(mustgather)
+                for accordion in index_context['accordiondata']:
+                    for item in accordion['iterable']:
+                        item.yaml_highlight_content
+                for pod in index_context['mapipods'] + index_context['mcopods']:
+                    pod.yaml_highlight_content
+                summary = index_context.summary()
+            finally:
+                contexts.highlighter, contexts.csr_decoder = highlighter, csr_decoder
+
+        for namespace, cache in collected.items():
+            connection.executemany('INSERT INTO cache VALUES (?, ?, ?)',
+                                   ((namespace, key, to_json(value)) for key, value in cache.values.items()))
+        connection.executemany('INSERT INTO meta VALUES (?, ?)', (
+            ('format', str(FORMAT_VERSION)),
+            ('okd_camgi_version', okd_camgi.version),
+            ('source', storage.path),
+            ('compiled', str(int(time.time()))),
+            ('summary', to_json(summary)),
+        ))
+        connection.commit()
+        connection.execute('VACUUM')
+    finally:
+        connection.close()
+    os.replace(partial_output, output)
+    return output
+
+
+def _write_file(connection, storage, relpath, mtime):
+    # the file is read in chunks, so that large logs are never held in memory
+    offsets = array('Q', [0]) if relpath.endswith('.log') else None
+    position = 0
+    with storage.open(relpath) as sourcefile:
+        seq = 0
+        while chunk := sourcefile.read(CHUNK_SIZE):
+            connection.execute('INSERT INTO chunks VALUES (?, ?, ?)', (relpath, seq, zlib.compress(chunk)))
+            if offsets is not None:
+                newline = chunk.find(b'\n')
+                while newline != -1:
+                    offsets.append(position + newline + 1)
+                    newline = chunk.find(b'\n', newline + 1)
+            position += len(chunk)
+            seq += 1
+    connection.execute('INSERT INTO files VALUES (?, ?, ?)', (relpath, position, mtime))
+    if offsets is not None:
+        # the last offset is the end of the file when the log ends with a newline
+        if offsets and offsets[-1] == position:
+            offsets.pop()
+        connection.execute('INSERT INTO lines VALUES (?, ?)', (relpath, zlib.compress(offsets.tobytes())))
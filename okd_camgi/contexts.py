@@ -1,17 +1,56 @@
 '''Context classes are the adaptors between data interfaces and templates.'''
 import base64
-from collections import UserDict, UserList
+from collections import OrderedDict, UserDict, UserList
+from functools import cached_property
+import hashlib
 import logging
 import os.path
+import posixpath
+from threading import Lock
+from types import MappingProxyType
 
-from cryptography import x509
-from cryptography.x509.oid import ExtensionOID
-from kubernetes.utils.quantity import parse_quantity
 from pygments import highlight
 from pygments.lexers import YamlLexer
 from pygments.formatters import HtmlFormatter
 
-from okd_camgi import interfaces
+from okd_camgi import interfaces, klog, profiling
+from okd_camgi.quantity import parse_quantity
+
+
+class YamlHighlighter:
+    '''highlights yaml as html, the results are memoized by a hash of the yaml
+
+    the memory cache holds up to max_entries results, when a disk_cache is set it is used as
+    a second tier that is shared between runs.
+    '''
+    def __init__(self, max_entries=4096, disk_cache=None):
+        self.max_entries = max_entries
+        self.disk_cache = disk_cache
+        self.lexer = YamlLexer()
+        self.formatter = HtmlFormatter()
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def highlight(self, content):
+        key = hashlib.sha256(content.encode()).hexdigest()
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            highlighted = self.disk_cache.get(key) if self.disk_cache is not None else None
+            if highlighted is None:
+                with profiling.phase('highlight yaml'):
+                    highlighted = highlight(content, self.lexer, self.formatter)
+                if self.disk_cache is not None:
+                    self.disk_cache.put(key, highlighted)
+            self._entries[key] = highlighted
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return highlighted
+
+
+# shared by all the contexts, main sets a disk cache on this when the cache is enabled
+highlighter = YamlHighlighter()
 
 
 # Base Classes
@@ -26,15 +65,35 @@ class AccordionDataContext(UserDict):
 
 
 class HighlightedYamlContext(UserDict):
+    '''context with highlighted yaml of its data
+
+    the yaml is only highlighted when yaml_highlight_content is read, so that it reflects
+    any changes made to the data before then.
+    '''
+    # keys added to the data by the context, they are not included in the yaml
+    context_keys = ()
+
     def __init__(self, initial):
         super().__init__(initial)
-        self.highlight()
+        # the original manifest text is used for the yaml, contexts that change the data must set this to none
+        self.source = getattr(initial, 'source', None)
+        self._yaml_highlight_content = None
+
+    def __missing__(self, key):
+        if key == 'yaml_highlight_content':
+            return self.yaml_highlight_content
+        raise KeyError(key)
+
+    @property
+    def yaml_highlight_content(self):
+        if self._yaml_highlight_content is None:
+            resource = interfaces.Resource({k: v for k, v in self.data.items() if k not in self.context_keys}, self.source)
+            self._yaml_highlight_content = highlighter.highlight(resource.as_yaml())
+        return self._yaml_highlight_content
 
     def highlight(self):
-        if self.data.get('yaml_highlight_content'):
-            del self.data['yaml_highlight_content']
-        content = highlight(interfaces.Resource(self.data).as_yaml(), YamlLexer(), HtmlFormatter())
-        self.data['yaml_highlight_content'] = content
+        '''discard the highlighted yaml, it will be highlighted again when next read'''
+        self._yaml_highlight_content = None
 
 
 class ResourceContext(HighlightedYamlContext):
@@ -43,6 +102,44 @@ class ResourceContext(HighlightedYamlContext):
         ''
 
 
+class ResourceProxyContext:
+    '''context for an interfaces.ResourceProxy
+
+    the fields are answered from those kept by the proxy, only the yaml loads the full manifest.
+    '''
+    __slots__ = ('resource',)
+
+    def __init__(self, resource):
+        self.resource = resource
+
+    def __getitem__(self, key):
+        if key in ('metadata', 'status', 'yaml_highlight_content'):
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    @property
+    def metadata(self):
+        return self.resource.metadata
+
+    @property
+    def status(self):
+        return self.resource.status
+
+    @property
+    def statusclasses(self):
+        ''
+
+    @property
+    def yaml_highlight_content(self):
+        return highlighter.highlight(self.resource.as_yaml())
+
+
 class NavListContext(UserDict):
     def __init__(self, cssid, anchor_name, content):
         initial = {
@@ -56,7 +153,8 @@ class NavListContext(UserDict):
 # Resource Specific Classes
 class ClusterAutoscalerContext(ResourceContext):
     def __init__(self, initial=None):
-        if initial is None or initial.get('spec').get('resourceLimits') is None:
+        defaulted = initial is None or initial.get('spec').get('resourceLimits') is None
+        if defaulted:
             # if we got an empty ClusterAutoscaler or are missing the limits, make sure we give the defaults
             initial.update({
                 'spec': {
@@ -74,47 +172,69 @@ class ClusterAutoscalerContext(ResourceContext):
             })
 
         super().__init__(initial)
+        if defaulted:
+            self.source = None
 
 
-class CSRContext(ResourceContext):
-    def __init__(self, initial=None):
-        super().__init__(initial)
+class CSRContext(ResourceProxyContext):
+    '''context for a certificate signing request
+
+    the request is decoded when the yaml is first read, or in a batch by CSRsContext.decode,
+    the status properties do not need the request to be decoded.
+    '''
+    __slots__ = ('_decoded', '_request')
 
-        updated = False
-        if self.data['spec'].get('request'):
-            self.data['spec']['request'] = CSRContext.decodeCSR(self.data['spec']['request'])
-            updated = True
+    def __init__(self, resource):
+        super().__init__(resource)
+        self._decoded = False
+        # the decoded request, or none if it has not been decoded
+        self._request = None
 
-        if self.data['status'].get('certificate'):
-            self.data['status']['certificate'] = '<omitted>'
-            updated = True
+    @property
+    def yaml_highlight_content(self):
+        return highlighter.highlight(self.as_yaml())
+
+    def as_yaml(self):
+        '''return the yaml of the csr, with the certificate omitted and the request decoded'''
+        self.decode()
+        if not self.resource.has_certificate and self._request is None:
+            return self.resource.as_yaml()
+        # the manifest is only loaded when its yaml is changed
+        body = self.resource.body()
+        if body.get('status', {}).get('certificate'):
+            body['status']['certificate'] = '<omitted>'
+        if self._request is not None and body.get('spec', {}).get('request'):
+            body['spec']['request'] = self._request
+        return interfaces.Resource(body).as_yaml()
 
-        if updated:
-            self.highlight()
+    @property
+    def encoded_request(self):
+        '''return the request if it has not been decoded yet, otherwise none'''
+        if self._decoded:
+            return None
+        return self.resource.request
+
+    def decode(self, decoded=None):
+        '''decode the request, decoded is given when the request was decoded in a batch'''
+        if self._decoded:
+            return
+        if decoded is None:
+            request = self.resource.request
+            decoded = csr_decoder.decode(request) if request else None
+        self._decoded = True
+        self._request = decoded
 
     @property
     def pending(self):
-        return self.data.get('status', {}) == {}
+        return not self.resource.has_status
 
     @property
     def denied(self):
-        try:
-            for cond in self.data['status']['conditions']:
-                if cond['type'] == 'Denied':
-                    return True
-        except:
-            pass
-        return False
+        return any(t == 'Denied' for t, _ in self.resource.conditions)
 
     @property
     def failed(self):
-        try:
-            for cond in self.data['status']['conditions']:
-                if cond['type'] == 'Failed':
-                    return True
-        except:
-            pass
-        return False
+        return any(t == 'Failed' for t, _ in self.resource.conditions)
 
     @property
     def statusclasses(self):
@@ -125,6 +245,13 @@ class CSRContext(ResourceContext):
 
     @staticmethod
     def decodeCSR(data):
+        return csr_decoder.decode(data)
+
+    @staticmethod
+    def _decodeCSR(data):
+        # cryptography is slow to import, it is only needed when there are csrs to decode
+        from cryptography import x509
+        from cryptography.x509.oid import ExtensionOID
         try:
             csr = x509.load_pem_x509_csr(base64.b64decode(data))
             extensions = {}
@@ -148,36 +275,128 @@ class CSRContext(ResourceContext):
             }
             return request
         except Exception as ex:
-            print(ex)
+            logging.error(f'unable to decode csr request, {str(ex)}')
             return data
 
 
 class CSRsContext(UserList):
-    @property
-    def pending(self):
-        return [csr for csr in self.data if csr.pending]
-
-    @property
-    def denied_or_failed(self):
-        return [csr for csr in self.data if csr.denied or csr.failed]
+    '''list of CSRContexts, the csrs are indexed by status when the context is created'''
+    def __init__(self, initial=None):
+        super().__init__(initial)
 
+        by_status = {}
+        denied_or_failed = []
+        for csr in self.data:
+            pending, denied, failed = csr.pending, csr.denied, csr.failed
+            if pending:
+                by_status.setdefault('pending', []).append(csr)
+            if denied:
+                by_status.setdefault('denied', []).append(csr)
+            if failed:
+                by_status.setdefault('failed', []).append(csr)
+            if denied or failed:
+                denied_or_failed.append(csr)
+        self.by_status = MappingProxyType({k: tuple(v) for k, v in by_status.items()})
+        self.pending = self.by_status.get('pending', ())
+        self.denied_or_failed = tuple(denied_or_failed)
+
+    def decode(self, map=map):
+        '''decode the requests of all the csrs in one batch, map is used to decode the requests that are not memoized'''
+        undecoded = []
+        requests = []
+        for csr in self.data:
+            request = csr.encoded_request
+            if request:
+                undecoded.append(csr)
+                requests.append(request)
+        decoded = csr_decoder.decode_all(requests, map)
+        for csr, request in zip(undecoded, decoded):
+            csr.decode(request)
+
+
+class CSRDecoder:
+    '''decodes the requests of certificate signing requests, the results are memoized by a hash of the request
+
+    approved and re-issued csrs often repeat the same request, so each distinct request is decoded once.
+    the memory cache holds up to max_entries results, when a disk_cache is set it is used as a second tier.
+    '''
+    def __init__(self, max_entries=16384, disk_cache=None):
+        self.max_entries = max_entries
+        self.disk_cache = disk_cache
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def decode(self, request):
+        return self.decode_all([request])[0]
+
+    def decode_all(self, requests, map=map):
+        '''decode a list of requests, map is used to decode the requests that are not memoized'''
+        keys = [hashlib.sha256(request.encode()).hexdigest() for request in requests]
+        results = {}
+        pending = {}
+        with self._lock:
+            for key, request in zip(keys, requests):
+                if key in results or key in pending:
+                    continue
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    results[key] = self._entries[key]
+                    continue
+                decoded = self.disk_cache.get(key) if self.disk_cache is not None else None
+                if decoded is not None:
+                    results[key] = decoded
+                    self._store(key, decoded)
+                else:
+                    pending[key] = request
+
+        if pending:
+            with profiling.phase('decode csr'):
+                decoded = map(CSRContext._decodeCSR, list(pending.values()))
+            with self._lock:
+                for key, request in zip(pending, decoded):
+                    results[key] = request
+                    self._store(key, request)
+                    if self.disk_cache is not None:
+                        self.disk_cache.put(key, request)
+        return [results[key] for key in keys]
+
+    def _store(self, key, decoded):
+        self._entries[key] = decoded
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+# shared by all the contexts, main sets a disk cache on this when the cache is enabled
+csr_decoder = CSRDecoder()
+
+
+class MachineContext(ResourceProxyContext):
+    __slots__ = ()
 
-class MachineContext(ResourceContext):
     @property
     def statusclasses(self):
         classes = []
 
-        if self.data.get('status', {}).get('phase') != 'Running':
+        if self.resource.phase != 'Running':
             classes.append('bg-danger text-white')
 
         return ' '.join(classes)
 
 
 class MachinesContext(UserList):
-    @property
-    def notrunning(self):
-        ret = list(filter(lambda m: m.get('status', {}).get('phase') != 'Running', self.data))
-        return ret
+    '''list of MachineContexts, the machines are indexed by phase when the context is created'''
+    def __init__(self, initial=None):
+        super().__init__(initial)
+
+        by_phase = {}
+        notrunning = []
+        for machine in self.data:
+            phase = machine.resource.phase
+            by_phase.setdefault(phase, []).append(machine)
+            if phase != 'Running':
+                notrunning.append(machine)
+        self.by_phase = MappingProxyType({k: tuple(v) for k, v in by_phase.items()})
+        self.notrunning = tuple(notrunning)
 
 
 class MachineSetContext(HighlightedYamlContext):
@@ -192,13 +411,15 @@ class MachineSetContext(HighlightedYamlContext):
         return self.data.get('metadata', {}).get('annotations', {}).get('machine.openshift.io/cluster-api-autoscaler-node-group-max-size')
 
 
-class NodeContext(ResourceContext):
+class NodeContext(ResourceProxyContext):
+    __slots__ = ()
+
     @property
     def statusclasses(self):
         classes = []
 
-        for condition in self.data.get('status', {}).get('conditions', []):
-            if condition.get('type') == 'Ready' and condition.get('status') == 'False':
+        for condition_type, status in self.resource.conditions:
+            if condition_type == 'Ready' and status == 'False':
                 classes.append('bg-danger text-white')
 
         return ' '.join(classes)
@@ -206,7 +427,7 @@ class NodeContext(ResourceContext):
     @property
     def cpu_allocatable(self):
         try:
-            return parse_quantity(self.data['status']['allocatable']['cpu'])
+            return parse_quantity(self.resource.allocatable['cpu'])
         except Exception as ex:
             logging.error(f'error parsing node cpu {str(ex)}')
         return 0
@@ -214,7 +435,7 @@ class NodeContext(ResourceContext):
     @property
     def cpu_capacity(self):
         try:
-            return parse_quantity(self.data['status']['capacity']['cpu'])
+            return parse_quantity(self.resource.capacity['cpu'])
         except Exception as ex:
             logging.error(f'error parsing node cpu {str(ex)}')
         return 0
@@ -222,7 +443,7 @@ class NodeContext(ResourceContext):
     @property
     def memory_allocatable(self):
         try:
-            return parse_quantity(self.data['status']['allocatable']['memory'])
+            return parse_quantity(self.resource.allocatable['memory'])
         except Exception as ex:
             logging.error(f'error parsing node memory {str(ex)}')
         return 0
@@ -230,7 +451,7 @@ class NodeContext(ResourceContext):
     @property
     def memory_capacity(self):
         try:
-            return parse_quantity(self.data['status']['capacity']['memory'])
+            return parse_quantity(self.resource.capacity['memory'])
         except Exception as ex:
             logging.error(f'error parsing node memory {str(ex)}')
         return 0
@@ -238,21 +459,22 @@ class NodeContext(ResourceContext):
     @property
     def nvidiagpu_allocatable(self):
         try:
-            return parse_quantity(self.data['status']['allocatable']['nvidia.com/gpu'])
+            return parse_quantity(self.resource.allocatable['nvidia.com/gpu'])
         except Exception as ex:
-            logging.info(f'no nvidia.com/gpu found for {self["metadata"]["name"]}')
+            logging.info(f'no nvidia.com/gpu found for {self.resource.name()}')
         return 0
 
     @property
     def nvidiagpu_capacity(self):
         try:
-            return parse_quantity(self.data['status']['capacity']['nvidia.com/gpu'])
+            return parse_quantity(self.resource.capacity['nvidia.com/gpu'])
         except Exception as ex:
-            logging.info(f'no nvidia.com/gpu found for {self["metadata"]["name"]}')
+            logging.info(f'no nvidia.com/gpu found for {self.resource.name()}')
         return 0
 
 
 class NodesContext(UserList):
+    '''list of NodeContexts, the resource totals and an index of the nodes by condition are built when the context is created'''
     def __init__(self, initial=None):
         super().__init__(initial)
 
@@ -262,7 +484,13 @@ class NodesContext(UserList):
         self.memory_capacity = 0
         self.nvidiagpu_allocatable = 0
         self.nvidiagpu_capacity = 0
+        # nodes by the type and status of their conditions, eg ('Ready', 'False')
+        by_condition = {}
         for node in self.data:
+            for condition in node.resource.conditions:
+                nodes = by_condition.setdefault(condition, [])
+                if not nodes or nodes[-1] is not node:
+                    nodes.append(node)
             self.cpu_allocatable += node.cpu_allocatable
             self.cpu_capacity += node.cpu_capacity
             self.memory_allocatable += node.memory_allocatable
@@ -272,88 +500,279 @@ class NodesContext(UserList):
         # convert to gigabytes
         self.memory_allocatable /= pow(10, 9)
         self.memory_capacity /= pow(10, 9)
+        self.by_condition = MappingProxyType({k: tuple(v) for k, v in by_condition.items()})
+        self.notready = self.by_condition.get(('Ready', 'False'), ())
+
+
+class ContainerLogContext(UserDict):
+    '''context for a container log, only the last tail_lines lines are read unless tail_lines is none or 0
+
+    the log text is not kept, it is read each time logs or log_chunks is used.
+    '''
+    def __init__(self, name, log, tail_lines=None):
+        initial = {
+            'name': name,
+            'log': log,
+            'tail_lines': tail_lines,
+        }
+        super().__init__(initial)
+
+    @cached_property
+    def start(self):
+        '''the offset in the log of the first line that is shown'''
+        if self.data['tail_lines']:
+            return self.data['log'].tail_offset(self.data['tail_lines'])
+        return 0
+
+    def log_chunks(self):
+        '''yield the shown lines of the log in chunks, so that the page can be streamed without holding the log'''
+        return self.data['log'].chunks(self.start)
 
     @property
-    def notready(self):
-        notready = []
-        for node in self.data:
-            for condition in node.get('status', {}).get('conditions', []):
-                if condition.get('type') == 'Ready' and condition.get('status') == 'False':
-                    notready.append(node)
-        return notready
+    def truncated(self):
+        return self.start > 0
+
+    @cached_property
+    def klog(self):
+        '''the klog records and autoscaler events of the log, parsed on first use'''
+        return klog.KlogIndex(self.data['log'])
 
 
 class PodContext(HighlightedYamlContext):
-    def __init__(self, pod):
+    context_keys = ('containerlogs',)
+
+    def __init__(self, pod, log_tail_lines=None):
         super().__init__(pod)
-        self.data['containerlogs'] = [{'name': k, 'logs': v} for k, v in pod.containerlogs.items()]
+        self.data['containerlogs'] = [ContainerLogContext(k, v, log_tail_lines) for k, v in pod.containerlogs.items()]
 
 
 # Main Index
-class IndexContext(UserDict):
-    '''Context for the index.html template'''
+class SummaryContext(UserDict):
+    '''Context for the summary of a must gather, it holds the resources the summary is made from
+
+    nothing is highlighted, decoded or read from the container logs, so it is quick to build.
+    '''
+    # the resources by their data key, as the kind, group and namespace of their manifests,
+    # and the context classes of each resource and of the list of them
+    resource_contexts = {
+        'clusterautoscalers': ('clusterautoscalers', 'autoscaling.openshift.io', None, ClusterAutoscalerContext, list),
+        'machineautoscalers': ('machineautoscalers', 'autoscaling.openshift.io', 'openshift-machine-api', ResourceContext, list),
+        'machinesets': ('machinesets', 'machine.openshift.io', 'openshift-machine-api', MachineSetContext, list),
+        'machines': ('machines', 'machine.openshift.io', 'openshift-machine-api', MachineContext, MachinesContext),
+        'nodes': ('nodes', 'core', None, NodeContext, NodesContext),
+        'csrs': ('certificatesigningrequests', 'certificates.k8s.io', None, CSRContext, CSRsContext),
+    }
+
     def __init__(self, mustgather):
-        mapipods = sorted([PodContext(pod) for pod in mustgather.pods('openshift-machine-api')], key=lambda p: p['metadata']['name'])
-        mcopods = sorted([PodContext(pod) for pod in mustgather.pods('openshift-machine-config-operator')], key=lambda p: p['metadata']['name'])
-        machineautoscalers = [ResourceContext(machineautoscaler) for machineautoscaler in mustgather.machineautoscalers]
-        clusterautoscalers = [ClusterAutoscalerContext(clusterautoscaler) for clusterautoscaler in mustgather.clusterautoscalers]
-        machinesets = [MachineSetContext(machineset) for machineset in mustgather.machinesets]
-        machines = MachinesContext([MachineContext(machine) for machine in mustgather.machines])
-        nodes = NodesContext([NodeContext(node) for node in mustgather.nodes])
-        csrs = CSRsContext(
-                [CSRContext(csr) for csr in mustgather.csrs])
-        cluster_resources = {
-            'cpu': {
-                'allocatable': nodes.cpu_allocatable,
-                'capacity': nodes.cpu_capacity,
-            },
-            'memory': {
-                'allocatable': nodes.memory_allocatable,
-                'capacity': nodes.memory_capacity,
-            },
-            'nvidiagpu': {
-                'allocatable': nodes.nvidiagpu_allocatable,
-                'capacity': nodes.nvidiagpu_capacity,
-            },
-        }
+        with profiling.phase('context machineautoscalers'):
+            machineautoscalers = [ResourceContext(machineautoscaler) for machineautoscaler in mustgather.machineautoscalers]
+        with profiling.phase('context clusterautoscalers'):
+            clusterautoscalers = [ClusterAutoscalerContext(clusterautoscaler) for clusterautoscaler in mustgather.clusterautoscalers]
+        with profiling.phase('context machinesets'):
+            machinesets = [MachineSetContext(machineset) for machineset in mustgather.machinesets]
+        with profiling.phase('context machines'):
+            machines = MachinesContext([MachineContext(machine) for machine in mustgather.machines])
+        with profiling.phase('context nodes'):
+            nodes = NodesContext([NodeContext(node) for node in mustgather.nodes])
+        with profiling.phase('context csrs'):
+            csrs = CSRsContext(
+                    [CSRContext(csr) for csr in mustgather.csrs])
 
         initial = {
-            'accordiondata': [
-                AccordionDataContext('ClusterAutoscalers', clusterautoscalers),
-                AccordionDataContext('MachineAutoscalers', machineautoscalers),
-                AccordionDataContext('MachineSets', machinesets),
-                AccordionDataContext('Machines', machines),
-                AccordionDataContext('Nodes', nodes),
-                AccordionDataContext('CSRs', csrs),
-            ],
             'basename': self.basename(mustgather.path),
             'clusterautoscalers': clusterautoscalers,
-            'cluster_resources': cluster_resources,
+            'cluster_resources': self.cluster_resources(nodes),
             'clusterversion': mustgather.clusterversion,
             'csrs': csrs,
-            'highlight_css': HtmlFormatter().get_style_defs('.highlight'),
             'machineautoscalers': machineautoscalers,
             'machines': machines,
             'machinesets': machinesets,
             'machinesets_participating': [ msc for msc in machinesets if msc.autoscaler_min],
-            'mapipods': mapipods,
-            'mcopods': mcopods,
             'nodes': nodes,
         }
         super().__init__(initial)
 
+    def reload(self, mustgather, changed):
+        '''update the context for the files of a must gather that have changed, returns the set of data keys that were rebuilt
+
+        mustgather holds the current files, and changed is a list of the paths, relative to its root,
+        that were added, removed or modified. only the resources of the changed manifests are loaded,
+        the others keep their contexts, and the lists and totals that hold them are built again.
+        '''
+        changed_files = {}
+        for relpath in changed:
+            changed_files.setdefault(posixpath.dirname(relpath), []).append(posixpath.basename(relpath))
+        rebuilt = set()
+        for key, (kind, group, namespace, item_class, list_class) in self.resource_contexts.items():
+            yaml_path = mustgather.build_manifest_path('', None, kind, group, namespace)
+            filenames = [f for f in changed_files.get(yaml_path, ()) if f.endswith('.yaml')]
+            if not filenames:
+                continue
+            with profiling.phase(f'update {kind}'):
+                if issubclass(item_class, ResourceProxyContext):
+                    # the contexts of the other resources are kept, they are in order of name
+                    by_name = {item.resource.name(): item for item in self.data[key]}
+                    for filename in filenames:
+                        by_name.pop(filename[:-len('.yaml')], None)
+                    man_paths = [posixpath.join(yaml_path, f) for f in filenames]
+                    for resource in mustgather.load_resources([p for p in man_paths if mustgather.storage.exists(p)], compact=True):
+                        by_name[resource.name()] = item_class(resource)
+                    items = [by_name[name] for name in sorted(by_name)]
+                else:
+                    # there are few of these, they are all loaded again
+                    items = [item_class(resource) for resource in getattr(mustgather, key)]
+                self.data[key] = list_class(items)
+            rebuilt.add(key)
+
+        if 'nodes' in rebuilt:
+            self.data['cluster_resources'] = self.cluster_resources(self.data['nodes'])
+            rebuilt.add('cluster_resources')
+        if 'machinesets' in rebuilt:
+            self.data['machinesets_participating'] = [msc for msc in self.data['machinesets'] if msc.autoscaler_min]
+            rebuilt.add('machinesets_participating')
+        if mustgather.build_manifest_path('', 'clusterversions', 'config.openshift.io', None, None) in changed:
+            self.data['clusterversion'] = mustgather.clusterversion
+            rebuilt.add('clusterversion')
+        return rebuilt
+
+    def summary(self):
+        '''return a summary of the must gather, with only plain types so it can be written as json'''
+        return {
+            'basename': self.data['basename'],
+            'clusterversion': self.data['clusterversion'],
+            'cluster_resources': {
+                resource: {k: str(v) for k, v in values.items()} for resource, values in self.data['cluster_resources'].items()
+            },
+            'clusterautoscalers': len(self.data['clusterautoscalers']),
+            'machineautoscalers': len(self.data['machineautoscalers']),
+            'machinesets': len(self.data['machinesets']),
+            'machinesets_participating': [m['metadata']['name'] for m in self.data['machinesets_participating']],
+            'autoscaler_limits': {
+                'cluster': [ca['spec'].get('resourceLimits', {}) for ca in self.data['clusterautoscalers']],
+                'machinesets': {
+                    m['metadata']['name']: {'min': m.autoscaler_min, 'max': m.autoscaler_max} for m in self.data['machinesets_participating']
+                },
+            },
+            'machines': len(self.data['machines']),
+            'machines_notrunning': [m['metadata']['name'] for m in self.data['machines'].notrunning],
+            'nodes': len(self.data['nodes']),
+            'nodes_notready': [n['metadata']['name'] for n in self.data['nodes'].notready],
+            'csrs': len(self.data['csrs']),
+            'csrs_pending': len(self.data['csrs'].pending),
+            'csrs_denied_or_failed': len(self.data['csrs'].denied_or_failed),
+        }
+
+    @staticmethod
+    def cluster_resources(nodes):
+        return {
+            'cpu': {
+                'allocatable': nodes.cpu_allocatable,
+                'capacity': nodes.cpu_capacity,
+            },
+            'memory': {
+                'allocatable': nodes.memory_allocatable,
+                'capacity': nodes.memory_capacity,
+            },
+            'nvidiagpu': {
+                'allocatable': nodes.nvidiagpu_allocatable,
+                'capacity': nodes.nvidiagpu_capacity,
+            },
+        }
+
     @staticmethod
     def basename(path):
         if path.endswith('/'):
             path = path[:-1]
         return os.path.basename(path)
 
+
+class IndexContext(SummaryContext):
+    '''Context for the index.html template'''
+    # the pods by their data key, as their namespace
+    pod_namespaces = {
+        'mapipods': 'openshift-machine-api',
+        'mcopods': 'openshift-machine-config-operator',
+    }
+
+    def __init__(self, mustgather, log_tail_lines=None, decode_csrs=True):
+        # when decode_csrs is false the csr requests are decoded when their yaml is read
+        self.decode_csrs = decode_csrs
+        with profiling.phase('context mapipods'):
+            mapipods = self.pod_contexts(mustgather, 'openshift-machine-api', log_tail_lines)
+        with profiling.phase('context mcopods'):
+            mcopods = self.pod_contexts(mustgather, 'openshift-machine-config-operator', log_tail_lines)
+        super().__init__(mustgather)
+        if decode_csrs:
+            with profiling.phase('decode csrs'):
+                self.data['csrs'].decode(mustgather.map)
+
+        self.data.update({
+            'accordiondata': self.accordions(),
+            'log_tail_lines': log_tail_lines,
+            'highlight_css': highlighter.formatter.get_style_defs('.highlight'),
+            'mapipods': mapipods,
+            'mcopods': mcopods,
+            # counts the reloads, so that a page can tell if it was rendered from an older context
+            'generation': 0,
+        })
+
+    def reload(self, mustgather, changed):
+        '''update the context for the files of a must gather that have changed, returns the set of data keys that were rebuilt
+
+        the pods of a namespace are loaded again when any of their manifests or logs have changed.
+        '''
+        rebuilt = super().reload(mustgather, changed)
+        if 'csrs' in rebuilt and self.decode_csrs:
+            # only the new csrs have requests that are not decoded
+            self.data['csrs'].decode(mustgather.map)
+        for key, namespace in self.pod_namespaces.items():
+            pods_path = mustgather.build_manifest_path('', None, 'pods', None, namespace)
+            if any(relpath.startswith(f'{pods_path}/') for relpath in changed):
+                with profiling.phase(f'update {key}'):
+                    self.data[key] = self.pod_contexts(mustgather, namespace, self.data['log_tail_lines'])
+                rebuilt.add(key)
+        if rebuilt:
+            self.data['accordiondata'] = self.accordions()
+            self.data['generation'] += 1
+        return rebuilt
+
+    def accordions(self):
+        return [
+            AccordionDataContext('ClusterAutoscalers', self.data['clusterautoscalers']),
+            AccordionDataContext('MachineAutoscalers', self.data['machineautoscalers']),
+            AccordionDataContext('MachineSets', self.data['machinesets']),
+            AccordionDataContext('Machines', self.data['machines']),
+            AccordionDataContext('Nodes', self.data['nodes']),
+            AccordionDataContext('CSRs', self.data['csrs']),
+        ]
+
+    @staticmethod
+    def pod_contexts(mustgather, namespace, log_tail_lines=None):
+        return sorted([PodContext(pod, log_tail_lines) for pod in mustgather.pods(namespace)], key=lambda p: p['metadata']['name'])
+
+    def pod(self, namespace, name):
+        '''return the PodContext for a pod or none if not found'''
+        for pod in self.data['mapipods'] + self.data['mcopods']:
+            if pod['metadata'].get('namespace') == namespace and pod['metadata']['name'] == name:
+                return pod
+        return None
+
+    def resource(self, cssid, name):
+        '''return the context for a resource in one of the accordions or none if not found'''
+        for accordion in self.data['accordiondata']:
+            if accordion['cssid'] != cssid:
+                continue
+            for item in accordion['iterable']:
+                if item['metadata']['name'] == name:
+                    return item
+        return None
+
     @staticmethod
     def cluster_autoscaler_deployment(mustgather):
         deployment = mustgather.clusterautoscaler.deployment
         if deployment is None:
             return 'Deployment not found, check <must-gather path>/namespaces/openshift-machine-api/apps/deployments.yaml'
-        content = highlight(deployment.as_yaml(), YamlLexer(), HtmlFormatter())
+        content = highlighter.highlight(deployment.as_yaml())
         anchor = deployment.name()
         return NavListContext(cssid='cluster-autoscaler-deployment', anchor_name=anchor, content=content)
 
@@ -362,7 +781,7 @@ class IndexContext(UserDict):
         ret = []
         for pod in  mustgather.clusterautoscaler.pods:
             name = pod.name()
-            content = highlight(pod.as_yaml(), YamlLexer(), HtmlFormatter())
+            content = highlighter.highlight(pod.as_yaml())
             ret.append(NavListContext(cssid=name, anchor_name=name, content=content))
         return ret
 
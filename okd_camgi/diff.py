@@ -0,0 +1,178 @@
+'''Comparison of the resources in two must gathers.'''
+from argparse import ArgumentParser
+import hashlib
+import json
+import logging
+import os
+import posixpath
+import sys
+
+from okd_camgi import profiling
+
+
+# the kinds of resources that are compared, as (name, kind, group, namespace)
+DIFF_KINDS = (
+    ('ClusterAutoscalers', 'clusterautoscalers', 'autoscaling.openshift.io', None),
+    ('MachineAutoscalers', 'machineautoscalers', 'autoscaling.openshift.io', 'openshift-machine-api'),
+    ('MachineSets', 'machinesets', 'machine.openshift.io', 'openshift-machine-api'),
+    ('Machines', 'machines', 'machine.openshift.io', 'openshift-machine-api'),
+    ('Nodes', 'nodes', 'core', None),
+    ('CSRs', 'certificatesigningrequests', 'certificates.k8s.io', None),
+)
+# fields that are bookkeeping of the api server, they are not compared
+IGNORED_FIELDS = ('metadata.managedFields', 'metadata.resourceVersion')
+# keys that change with every status update, they are not compared
+IGNORED_KEYS = ('lastHeartbeatTime',)
+# list items that are dicts with one of these keys are matched by it, instead of by their position
+LIST_KEYS = ('type', 'name')
+
+
+def manifest_digests(mustgather, kind, group=None, namespace=None):
+    '''return a dict of resource name to (manifest path, content digest) for the manifests of a kind'''
+    yaml_path = mustgather.build_manifest_path('', None, kind, group, namespace)
+    storage = mustgather.storage
+    if not storage.isdir(yaml_path):
+        return {}
+    digests = {}
+    for filename in storage.listdir(yaml_path):
+        if not filename.endswith('.yaml'):
+            continue
+        man_path = posixpath.join(yaml_path, filename)
+        digest = hashlib.sha1(storage.read_text(man_path).encode()).hexdigest()
+        digests[filename[:-len('.yaml')]] = (man_path, digest)
+    return digests
+
+
+def field_diff(old, new, path=''):
+    '''return a list of dicts with the field path, and old and new values, of the fields that differ
+
+    a value that is only on one side has no old or new key.
+    '''
+    if path in IGNORED_FIELDS:
+        return []
+    if isinstance(old, dict) and isinstance(new, dict):
+        children = {key: f'{path}.{key}' if path else str(key) for key in list(old) + list(new) if key not in IGNORED_KEYS}
+    elif isinstance(old, list) and isinstance(new, list):
+        list_key = _list_key(old, new)
+        if list_key is not None:
+            old, new = {i[list_key]: i for i in old}, {i[list_key]: i for i in new}
+        else:
+            old, new = dict(enumerate(old)), dict(enumerate(new))
+        children = {key: f'{path}[{key}]' for key in list(old) + list(new)}
+    elif old != new:
+        return [{'field': path, 'old': old, 'new': new}]
+    else:
+        return []
+
+    changes = []
+    for key, child in children.items():
+        if key not in new:
+            changes.append({'field': child, 'old': old[key]})
+        elif key not in old:
+            changes.append({'field': child, 'new': new[key]})
+        else:
+            changes.extend(field_diff(old[key], new[key], child))
+    return changes
+
+
+def _list_key(old, new):
+    # return the key that the items of two lists can be matched by, or none if they are matched by position
+    for key in LIST_KEYS:
+        for items in (old, new):
+            if not all(isinstance(i, dict) and isinstance(i.get(key), str) for i in items):
+                break
+            if len({i[key] for i in items}) != len(items):
+                break
+        else:
+            return key
+    return None
+
+
+def diff_must_gathers(old, new):
+    '''compare the resources of two MustGathers, returns a dict of the changes for each kind in DIFF_KINDS
+
+    the changes of a kind are the names of the added and removed resources, the field changes of
+    each changed resource, and the number that are unchanged. manifests are compared by a digest
+    of their content first, so only the manifests that have changed are parsed.
+    '''
+    result = {}
+    for name, kind, group, namespace in DIFF_KINDS:
+        with profiling.phase(f'diff {kind}'):
+            old_digests = manifest_digests(old, kind, group, namespace)
+            new_digests = manifest_digests(new, kind, group, namespace)
+            both = sorted(n for n in old_digests.keys() & new_digests.keys() if old_digests[n][1] != new_digests[n][1])
+            old_manifests = old.load_manifests([old_digests[n][0] for n in both])
+            new_manifests = new.load_manifests([new_digests[n][0] for n in both])
+            changed = {}
+            for resource_name, old_manifest, new_manifest in zip(both, old_manifests, new_manifests):
+                changes = field_diff(old_manifest or {}, new_manifest or {})
+                if changes:
+                    changed[resource_name] = changes
+            result[name] = {
+                'added': sorted(new_digests.keys() - old_digests.keys()),
+                'removed': sorted(old_digests.keys() - new_digests.keys()),
+                'changed': changed,
+                'unchanged': len(old_digests.keys() & new_digests.keys()) - len(changed),
+            }
+    return result
+
+
+def format_diff(result):
+    '''return the diff result as lines of text'''
+    lines = []
+    for name, changes in result.items():
+        lines.append(f'{name}: {len(changes["added"])} added, {len(changes["removed"])} removed, '
+                     f'{len(changes["changed"])} changed, {changes["unchanged"]} unchanged')
+        lines.extend(f'  + {n}' for n in changes['added'])
+        lines.extend(f'  - {n}' for n in changes['removed'])
+        for resource_name, fields in changes['changed'].items():
+            lines.append(f'  ~ {resource_name}')
+            for field in fields:
+                old = json.dumps(field['old'], default=str) if 'old' in field else '(none)'
+                new = json.dumps(field['new'], default=str) if 'new' in field else '(none)'
+                lines.append(f'      {field["field"]}: {old} -> {new}')
+    return lines
+
+
+def diff_main(argv):
+    parser = ArgumentParser(prog='okd-camgi diff', description='compare the resources in two must-gathers')
+    parser.add_argument('old', help='the earlier must-gather, a directory, tar archive or file compiled by okd-camgi index')
+    parser.add_argument('new', help='the later must-gather')
+    parser.add_argument('--format', choices=('text', 'json'), default='text', help='output format')
+    parser.add_argument('--output', help='output filename, the diff is written to stdout by default')
+    parser.add_argument('--jobs', type=int, default=1, help='number of worker processes to use when parsing changed manifests')
+    parser.add_argument('--verbose', action='store_true', help='enable verbose logging')
+    args = parser.parse_args(argv)
+
+    if args.verbose:
+        logging.basicConfig(level=logging.DEBUG)
+
+    from okd_camgi.interfaces import MustGather
+    from okd_camgi.main import is_tar_archive, open_must_gather
+
+    paths = []
+    for path in (args.old, args.new):
+        path = os.path.abspath(path)
+        opened = open_must_gather(path, tar=is_tar_archive(path))
+        if opened is None:
+            logging.error(f'"{path}" does not appear to be a valid must-gather archive')
+            sys.exit(1)
+        paths.append(opened)
+
+    try:
+        with MustGather(paths[0], jobs=args.jobs) as old, MustGather(paths[1], jobs=args.jobs) as new:
+            result = diff_must_gathers(old, new)
+    finally:
+        for path in paths:
+            if not isinstance(path, str):
+                path.close()
+
+    if args.format == 'json':
+        text = json.dumps(result, indent=2, default=str) + '\n'
+    else:
+        text = ''.join(f'{line}\n' for line in format_diff(result))
+    if args.output is None:
+        sys.stdout.write(text)
+    else:
+        with open(args.output, 'w') as outputfile:
+            outputfile.write(text)
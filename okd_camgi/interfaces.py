@@ -1,33 +1,414 @@
 '''Interfaces into the must gather artifacts and data.'''
+import codecs
 from collections import UserDict
-from copy import deepcopy
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+import hashlib
 import logging
+import mmap
+import multiprocessing
 import os.path
+import posixpath
 
 from dateutil.parser import isoparse
 import yaml
 
+from okd_camgi import profiling
+from okd_camgi.compiled import CompiledStorage, is_compiled
+from okd_camgi.storage import DirectoryStorage
+
+
+# the paths, relative to the must gather root, that are read by the MustGather
+WANTED_PATHS = (
+    'cluster-scoped-resources/autoscaling.openshift.io/clusterautoscalers',
+    'cluster-scoped-resources/certificates.k8s.io/certificatesigningrequests',
+    'cluster-scoped-resources/config.openshift.io/clusterversions.yaml',
+    'cluster-scoped-resources/core/nodes',
+    'namespaces/openshift-machine-api',
+    'namespaces/openshift-machine-config-operator',
+)
+
+# the size of the chunks that logs are read in when they are streamed
+READ_SIZE = 64 * 1024
+
+# the number of manifests that are loaded at once for compact resources
+COMPACT_BATCH_SIZE = 1000
+
+# the paths that are scanned into the inventory of a must gather directory
+SCANNED_PATHS = ('version',) + WANTED_PATHS
+
+# the start method of the worker processes, forking a process while other threads hold locks can deadlock
+# the children, and the server loads must gathers on request threads while other threads are running
+MP_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+# prefer the libyaml backed loader when it is available, it is much faster than the pure python loader
+YamlLoader = getattr(yaml, 'CFullLoader', yaml.FullLoader)
+YamlDumper = getattr(yaml, 'CDumper', yaml.Dumper)
+
+
+def parse_manifest(content, source):
+    '''parse the yaml content of a manifest, returns a tuple of (resource, error message)
+
+    this is a module level function so that it can be dispatched to a process pool.
+    '''
+    try:
+        return yaml.load(content, Loader=YamlLoader), None
+    except yaml.YAMLError as ex:
+        # if the yaml is bad, report an error and ignore the manifest
+        mark = getattr(ex, 'problem_mark', None)
+        if mark is None:
+            return None, f'unable to parse {source}, {str(ex)}'
+        return None, f'unable to parse {source}, error at line:{mark.line+1} col:{mark.column+1}'
+
+
+def wanted_member(name):
+    '''return true if an archive member name is within one of the wanted paths of a must gather
+
+    the must gather root is not known while reading an archive, so any directory in the
+    member name may be the root.
+    '''
+    parts = name.split('/')
+    # the version file at the root is read when the archive is compiled
+    if parts[-1] == 'version':
+        return True
+    for i, part in enumerate(parts):
+        if part not in ('cluster-scoped-resources', 'namespaces'):
+            continue
+        relpath = '/'.join(parts[i:])
+        for wanted in WANTED_PATHS:
+            if relpath == wanted or relpath.startswith(f'{wanted}/'):
+                return True
+    return False
+
+
+def strip_managed_fields(text):
+    '''remove the metadata.managedFields block from the text of a yaml manifest
+
+    returns a tuple of (text, removed), the text is returned unchanged if it is not in the
+    block style that must-gather manifests are written in.
+    '''
+    lines = text.splitlines(keepends=True)
+    in_metadata = False
+    child_indent = None
+    start = None
+    for i, line in enumerate(lines):
+        stripped = line.lstrip(' ')
+        if stripped.strip() == '' or stripped.startswith('#'):
+            continue
+        indent = len(line) - len(stripped)
+        if start is not None:
+            # the block continues while lines are indented further than the key, or are list items at the same indent
+            if indent > child_indent or (indent == child_indent and (stripped.startswith('- ') or stripped.rstrip() == '-')):
+                continue
+            return ''.join(lines[:start] + lines[i:]), True
+        if indent == 0:
+            in_metadata = stripped.rstrip() == 'metadata:'
+            continue
+        if in_metadata:
+            if child_indent is None:
+                child_indent = indent
+            if indent == child_indent and stripped.startswith('managedFields:'):
+                start = i
+    if start is not None:
+        return ''.join(lines[:start]), True
+    return text, False
+
 
 class Resource(UserDict):
+    def __init__(self, initial=None, source=None):
+        super().__init__(initial)
+        # the original manifest text, or a function that returns it
+        self.source = source
+
     def name(self):
         return self.data.get('metadata', {}).get('name')
 
+    def source_text(self):
+        '''return the original manifest text or none if it is not known'''
+        if callable(self.source):
+            try:
+                return self.source()
+            except Exception as ex:
+                logging.debug(f'unable to read manifest source for {self.name()}, {str(ex)}')
+                return None
+        return self.source
+
+    def as_yaml(self):
+        metadata = self.data.get('metadata')
+        has_managed_fields = isinstance(metadata, dict) and bool(metadata.get('managedFields'))
+
+        # prefer the original text, it keeps the key order and formatting from the must gather
+        source = self.source_text()
+        if source is not None:
+            text, removed = strip_managed_fields(source)
+            if removed or not has_managed_fields:
+                return text
+
+        data = dict(self.data)
+        if has_managed_fields:
+            data['metadata'] = {k: v for k, v in metadata.items() if k != 'managedFields'}
+        return yaml.dump(data, Dumper=YamlDumper)
+
+
+class ResourceProxy:
+    '''compact stand in for a Resource, holding only the fields that the contexts use
+
+    the full manifest is loaded by calling body, and is not kept, so that large numbers of
+    nodes, machines and csrs take little memory.
+    '''
+    __slots__ = ('_name', 'namespace', 'annotations', '_status', 'conditions', 'request', 'has_certificate',
+                 'has_managed_fields', 'source', '_load')
+
+    # the fields of the status that are kept, as they are in the manifest
+    STATUS_FIELDS = ('phase', 'nodeRef', 'capacity', 'allocatable')
+
+    def __init__(self, resource, load, source=None):
+        metadata = resource.get('metadata') or {}
+        spec = resource.get('spec') or {}
+        status = resource.get('status') or {}
+        self._name = metadata.get('name')
+        self.namespace = metadata.get('namespace')
+        self.annotations = metadata.get('annotations') or {}
+        # none when the manifest has no status, or an empty one
+        self._status = {k: status[k] for k in self.STATUS_FIELDS if k in status} if status else None
+        # the (type, status) of each of the status conditions
+        self.conditions = tuple((c.get('type'), c.get('status')) for c in status.get('conditions') or () if isinstance(c, dict))
+        # the encoded request of a csr, and whether it has been issued a certificate
+        self.request = spec.get('request')
+        self.has_certificate = bool(status.get('certificate'))
+        self.has_managed_fields = bool(metadata.get('managedFields'))
+        # the original manifest text, or a function that returns it
+        self.source = source
+        self._load = load
+
+    def name(self):
+        return self._name
+
+    source_text = Resource.source_text
+
+    @property
+    def metadata(self):
+        '''the kept fields of the metadata'''
+        return {'name': self._name, 'namespace': self.namespace, 'annotations': self.annotations}
+
+    @property
+    def has_status(self):
+        return self._status is not None
+
+    @property
+    def status(self):
+        '''the kept fields of the status that are in the manifest, or none if the resource has no status'''
+        if self._status is None:
+            return None
+        status = dict(self._status)
+        if self.conditions:
+            status['conditions'] = [{'type': t, 'status': s} for t, s in self.conditions]
+        return status
+
+    @property
+    def phase(self):
+        return (self._status or {}).get('phase')
+
+    @property
+    def node_ref(self):
+        return (self._status or {}).get('nodeRef')
+
+    @property
+    def capacity(self):
+        return (self._status or {}).get('capacity') or {}
+
+    @property
+    def allocatable(self):
+        return (self._status or {}).get('allocatable') or {}
+
+    def body(self):
+        '''load and return the full manifest, it is parsed again on each call'''
+        return self._load() or {}
+
     def as_yaml(self):
-        data = deepcopy(self.data)
-        if data.get('metadata', {}).get('managedFields'):
-            del data['metadata']['managedFields']
-        return yaml.dump(data)
+        # the original text is used without loading the manifest when it can be
+        source = self.source_text()
+        if source is not None:
+            text, removed = strip_managed_fields(source)
+            if removed or not self.has_managed_fields:
+                return text
+        return Resource(self.body()).as_yaml()
+
+
+class RangeBuffer:
+    '''buffer of a file in a storage that reads ranges itself, slicing it reads only that range
+
+    the last range read is kept with up to READ_SIZE bytes after it, so that reading lines in order
+    does not read the storage again for each line.
+    '''
+    def __init__(self, storage, relpath):
+        self.storage = storage
+        self.relpath = relpath
+        self._size = storage.stat(relpath)[0]
+        self._start = 0
+        self._data = b''
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step not in (None, 1):
+            raise TypeError('only contiguous slices can be read')
+        start, end, _ = key.indices(self._size)
+        if start >= end:
+            return b''
+        if start < self._start or end > self._start + len(self._data):
+            self._start = start
+            self._data = self.storage.read_range(self.relpath, start, max(end, start + READ_SIZE))
+        return self._data[start - self._start:end - self._start]
+
+
+class LogHandle:
+    '''handle to a container log file in a must gather
+
+    the log content is only read when requested, and is accessed through a memory map
+    when the storage provides a real file, so large logs are never read in full.
+    '''
+    def __init__(self, storage, relpath):
+        self.storage = storage
+        self.relpath = relpath
+
+    @property
+    def size(self):
+        return self.storage.stat(self.relpath)[0]
+
+    def read(self, start=0, end=None):
+        '''return the bytes of the log from start up to end'''
+        with self.buffer() as buf:
+            return bytes(buf[start:end])
+
+    def blocks(self, start=0, end=None, size=READ_SIZE):
+        '''yield the bytes of the log from start up to end in blocks of size bytes
+
+        the log is opened once for all the blocks, and end defaults to its length when it is opened.
+        '''
+        with self.buffer() as buf:
+            end = len(buf) if end is None else min(end, len(buf))
+            for position in range(start, end, size):
+                yield bytes(buf[position:min(position + size, end)])
+
+    def chunks(self, start=0, size=READ_SIZE):
+        '''yield the log from start to its end as strings of about size bytes'''
+        # characters split between chunks are decoded with the chunk they end in
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        for block in self.blocks(start, size=size):
+            text = decoder.decode(block)
+            if text:
+                yield text
+        text = decoder.decode(b'', final=True)
+        if text:
+            yield text
+
+    def tail(self, count):
+        '''return the last count lines of the log as a string'''
+        with self.buffer() as buf:
+            return bytes(buf[self._tail_offset(buf, count):]).decode('utf-8', errors='replace')
+
+    def tail_offset(self, count):
+        '''return the offset of the start of the last count lines of the log'''
+        with self.buffer() as buf:
+            return self._tail_offset(buf, count)
+
+    def _tail_offset(self, buf, count):
+        # the offset of the start of the last count lines in the buffer of the log
+        offsets = self._line_offsets()
+        if offsets is not None:
+            if count <= 0 or len(offsets) == 0:
+                return len(buf)
+            return offsets[max(0, len(offsets) - count)]
+        buf = self._searchable(buf)
+        end = len(buf)
+        pos = end - 1 if end > 0 and buf[end - 1] == ord('\n') else end
+        for _ in range(count):
+            pos = buf.rfind(b'\n', 0, pos)
+            if pos == -1:
+                break
+        return min(pos + 1, end)
+
+    def lines(self, start, count):
+        '''return count lines of the log beginning at line number start, counting from 0, as a string'''
+        offsets = self._line_offsets()
+        with self.buffer() as buf:
+            if offsets is not None:
+                begin = offsets[start] if start < len(offsets) else len(buf)
+                end = offsets[start + count] if start + count < len(offsets) else len(buf)
+            else:
+                buf = self._searchable(buf)
+                begin = self._skip_lines(buf, 0, start)
+                end = self._skip_lines(buf, begin, count)
+            return bytes(buf[begin:end]).decode('utf-8', errors='replace')
+
+    def _line_offsets(self):
+        # the offsets of the start of each line, when the storage has recorded them
+        if hasattr(self.storage, 'line_offsets'):
+            return self.storage.line_offsets(self.relpath)
+        return None
+
+    @contextmanager
+    def buffer(self):
+        '''yield the log as a buffer that can be sliced, it is opened once for all the reads made from it
+
+        the buffer is an mmap of the log if possible, otherwise the log bytes. its length is the size of the
+        log when it is opened, which is current even if the log has grown since the must gather was scanned.
+        '''
+        # storages that hold files in chunks can read a range without reading the whole log
+        if hasattr(self.storage, 'read_range'):
+            yield RangeBuffer(self.storage, self.relpath)
+            return
+        with self.storage.open(self.relpath) as logfile:
+            try:
+                fileno = logfile.fileno()
+            except (AttributeError, OSError):
+                fileno = None
+            if fileno is None or os.fstat(fileno).st_size == 0:
+                yield logfile.read()
+                return
+            with mmap.mmap(fileno, 0, access=mmap.ACCESS_READ) as buf:
+                yield buf
+
+    @staticmethod
+    def _searchable(buf):
+        # the lines of a RangeBuffer can only be found by reading the whole log
+        return buf[:] if isinstance(buf, RangeBuffer) else buf
+
+    @staticmethod
+    def _skip_lines(buf, pos, count):
+        # return the offset after skipping count lines from pos
+        for _ in range(count):
+            pos = buf.find(b'\n', pos)
+            if pos == -1:
+                return len(buf)
+            pos += 1
+        return pos
 
 
 class Pod(Resource):
-    def __init__(self, resource, containerlogs):
-        super().__init__(resource)
+    def __init__(self, resource, containerlogs, source=None):
+        super().__init__(resource, source)
         self.containerlogs = containerlogs
 
 
 class MustGather:
-    def __init__(self, path):
-        self.path = path
+    def __init__(self, path, jobs=1, cache=None):
+        # path may be a directory, a file compiled by okd-camgi index, or a storage from the storage module.
+        # the parts of a directory that are read are scanned once, up front. a compiled file opened here
+        # is not closed with the MustGather, because the logs of the resources still read from it.
+        if not isinstance(path, str):
+            self.storage = path
+        elif is_compiled(path):
+            self.storage = CompiledStorage(path)
+        else:
+            self.storage = DirectoryStorage(path, scan=SCANNED_PATHS)
+        self.path = self.storage.path
+        self.jobs = max(1, jobs or 1)
+        self.cache = cache
+        self._executor = None
         self._clusterautoscalers = None
         self._machineautoscalers = None
         self._machines = None
@@ -39,7 +420,8 @@ class MustGather:
     @property
     def csrs(self):
         if self._csrs is None:
-            self._csrs = self.resources('certificatesigningrequests', 'certificates.k8s.io')
+            csrs = self.resources('certificatesigningrequests', 'certificates.k8s.io', compact=True)
+            self._csrs = sorted(csrs, key=lambda c: c.name())
         return self._csrs
 
     @property
@@ -72,7 +454,7 @@ class MustGather:
     @property
     def machines(self):
         if self._machines is None:
-            machines = self.resources('machines', 'machine.openshift.io', 'openshift-machine-api')
+            machines = self.resources('machines', 'machine.openshift.io', 'openshift-machine-api', compact=True)
             self._machines = sorted(machines, key=lambda m: m.name())
         return self._machines
 
@@ -86,44 +468,117 @@ class MustGather:
     @property
     def nodes(self):
         if self._nodes is None:
-            nodes = self.resources('nodes', 'core')
+            nodes = self.resources('nodes', 'core', compact=True)
             self._nodes = sorted(nodes, key=lambda n: n.name())
         return self._nodes
 
     def pods(self, namespace):
         if self._pods.get(namespace) is None:
-            pods = []
-            pods_path = self.build_manifest_path(self.path, None, 'pods', None, namespace)
-            # list all pods in the namespace
-            for podname in os.listdir(pods_path):
-                containerlogs = {}
-                # list all files in the pod dir (containers and manifest)
-                for filename in os.listdir(os.path.join(pods_path, podname)):
-                    resource = None
-                    currentlog = os.path.join(pods_path, podname, filename, filename, 'logs', 'current.log')
-                    # there should be a manifest for the pod itself
-                    if filename == f'{podname}.yaml':
-                        logging.debug(f'loading {filename}')
-                        with open(os.path.join(pods_path, podname, filename)) as man_file:
-                            try:
-                                resource = yaml.load(man_file.read(), Loader=yaml.FullLoader)
-                            except yaml.YAMLError as ex:
-                                # if the yaml is bad, log an error and ignore the manifest
-                                mark = ex.problem_mark
-                                logging.error(f'unable to parse {filename}, error at line:{mark.line+1} col:{mark.column+1}')
-                                resource = None
-                    # sub-directories are containers within the pod, check to see if log files exist
-                    elif os.path.exists(currentlog):
-                        logging.debug(f'found container logs for {filename}, opening {currentlog}')
-                        with open(currentlog) as log:
-                            containerlogs[filename] = log.read()
-                    else:
-                        continue
-                    if resource is not None:
-                        pods.append(Pod(resource, containerlogs))
-            self._pods[namespace] = pods
+            with profiling.phase(f'load pods {namespace}'):
+                self._pods[namespace] = self._load_pods(namespace)
         return self._pods[namespace]
 
+    def _load_pods(self, namespace):
+        podmanifests = []
+        pods_path = self.build_manifest_path('', None, 'pods', None, namespace)
+        # list all pods in the namespace
+        podnames = self.storage.listdir(pods_path) if self.storage.isdir(pods_path) else []
+        for podname in podnames:
+            containerlogs = {}
+            # list all files in the pod dir (containers and manifest)
+            for filename in self.storage.listdir(posixpath.join(pods_path, podname)):
+                currentlog = posixpath.join(pods_path, podname, filename, filename, 'logs', 'current.log')
+                # there should be a manifest for the pod itself
+                if filename == f'{podname}.yaml':
+                    podmanifests.append((posixpath.join(pods_path, podname, filename), containerlogs))
+                # sub-directories are containers within the pod, check to see if log files exist
+                elif self.storage.exists(currentlog):
+                    logging.debug(f'found container logs for {filename} in {self.storage.describe(currentlog)}')
+                    containerlogs[filename] = LogHandle(self.storage, currentlog)
+        resources = self.load_manifests([man_path for man_path, _ in podmanifests])
+        pods = []
+        for resource, (man_path, containerlogs) in zip(resources, podmanifests):
+            if resource is not None:
+                pods.append(Pod(resource, containerlogs, partial(self.storage.read_text, man_path)))
+        return pods
+
+    def fingerprint(self):
+        '''return a digest of the names, sizes and mtimes of the files that are read from the must gather'''
+        digest = hashlib.sha1()
+        for wanted in WANTED_PATHS:
+            for relpath, size, mtime in self.storage.walk(wanted):
+                digest.update(f'{relpath}:{size}:{mtime}\n'.encode())
+        return digest.hexdigest()
+
+    def close(self):
+        '''release the worker processes used for parallel loading'''
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def load_manifests(self, paths):
+        '''load a list of manifest paths, relative to the must gather root, returns a list of the parsed manifests or none for each path
+
+        when jobs is greater than 1 the parsing is spread across a pool of worker processes.
+        if there is a parse cache, manifests found in it are not parsed again.
+        '''
+        resources = [None] * len(paths)
+        keys = [None] * len(paths)
+        # indices of the manifests that need to be parsed
+        pending = []
+        contents = []
+        # compiled storages hold the parsed manifests
+        manifest = getattr(self.storage, 'manifest', None)
+        for i, man_path in enumerate(paths):
+            if manifest is not None:
+                resources[i] = manifest(man_path)
+                if resources[i] is not None:
+                    continue
+            if self.cache is not None:
+                size, mtime = self.storage.stat(man_path)
+                read = lambda: self.storage.read_text(man_path).encode()
+                keys[i] = self.cache.key(self.storage.describe(man_path), size, mtime, read)
+                resources[i] = self.cache.get(keys[i])
+                if resources[i] is not None:
+                    logging.debug(f'loaded {self.storage.describe(man_path)} from cache')
+                    continue
+            logging.debug(f'loading {self.storage.describe(man_path)}')
+            contents.append(self.storage.read_text(man_path))
+            pending.append(i)
+
+        pending_paths = [self.storage.describe(paths[i]) for i in pending]
+        with profiling.phase('parse yaml'):
+            results = self.map(parse_manifest, contents, pending_paths)
+
+        for i, (resource, error) in zip(pending, results):
+            if error is not None:
+                logging.error(error)
+            elif resource is not None and self.cache is not None:
+                self.cache.put(keys[i], resource)
+            resources[i] = resource
+        return resources
+
+    def map(self, func, *iterables):
+        '''return a list of func applied to the items of iterables, like the map builtin
+
+        when jobs is greater than 1 the calls are spread across a pool of worker processes,
+        so func and the items must be picklable, and func must be importable from its module.
+        '''
+        iterables = [list(i) for i in iterables]
+        count = min(len(i) for i in iterables)
+        if self.jobs > 1 and count > 1:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.jobs, mp_context=multiprocessing.get_context(MP_START_METHOD))
+            chunksize = max(1, count // (self.jobs * 4))
+            return list(self._executor.map(func, *iterables, chunksize=chunksize))
+        return list(map(func, *iterables))
+
     @staticmethod
     def build_manifest_path(path, name, kind, group, namespace):
         pathlist = [path]
@@ -142,32 +597,49 @@ class MustGather:
 
     def resource_or_none(self, name, kind, group=None, namespace=None):
         '''get a resource or none if not found'''
-        man_path = self.build_manifest_path(self.path, name, kind, group, namespace)
+        man_path = self.build_manifest_path('', name, kind, group, namespace)
 
-        if not os.path.exists(man_path):
+        if not self.storage.exists(man_path):
             return None
-        logging.debug(f'loading {group}/{kind} yaml from {man_path}')
-        with open(man_path) as man_file:
-            try:
-                resource = yaml.load(man_file.read(), Loader=yaml.FullLoader)
-            except yaml.YAMLError as ex:
-                # if the yaml is bad, log an error and ignore the manifest
-                mark = ex.problem_mark
-                logging.error(f'unable to parse {man_path}, error at line:{mark.line+1} col:{mark.column+1}')
-                return None
-            return Resource(resource)
+        logging.debug(f'loading {group}/{kind} yaml from {self.storage.describe(man_path)}')
+        resource = self.load_manifests([man_path])[0]
+        if resource is None:
+            return None
+        return Resource(resource, partial(self.storage.read_text, man_path))
+
+    def resources(self, kind, group=None, namespace=None, compact=False):
+        # when compact is true ResourceProxies are returned, and the manifests are loaded again when needed
+        with profiling.phase(f'load {kind}'):
+            return self._load_resources(kind, group, namespace, compact)
 
-    def resources(self, kind, group=None, namespace=None):
-        yaml_path = self.build_manifest_path(self.path, None, kind, group, namespace)
+    def load_manifest(self, man_path):
+        '''load a single manifest path, relative to the must gather root, returns the parsed manifest or none'''
+        return self.load_manifests([man_path])[0]
+
+    def _load_resources(self, kind, group=None, namespace=None, compact=False):
+        yaml_path = self.build_manifest_path('', None, kind, group, namespace)
         resourcelist = []
-        if not os.path.exists(yaml_path):
+        if not self.storage.isdir(yaml_path):
             return resourcelist
-        for f in os.listdir(yaml_path):
-            if not f.endswith('.yaml'):
-                continue
-            resource = self.resource_or_none(f[:-5], kind, group, namespace)
+        filenames = [f for f in self.storage.listdir(yaml_path) if f.endswith('.yaml')]
+        # compact resources are loaded in batches, so only one batch of full manifests is held at a time
+        batch_size = COMPACT_BATCH_SIZE if compact else max(1, len(filenames))
+        for start in range(0, len(filenames), batch_size):
+            batch = filenames[start:start + batch_size]
+            resourcelist.extend(self.load_resources([posixpath.join(yaml_path, f) for f in batch], compact))
+        return resourcelist
+
+    def load_resources(self, man_paths, compact=False):
+        '''load a list of manifest paths as Resources, or ResourceProxies when compact is true
+
+        the manifests that do not produce a resource are left out.
+        '''
+        resourcelist = []
+        for man_path, resource in zip(man_paths, self.load_manifests(man_paths)):
             if resource is None:
-                logging.error(f'Found yaml {f} did not produce a resource.')
+                logging.error(f'Found yaml {posixpath.basename(man_path)} did not produce a resource.')
+            elif compact:
+                resourcelist.append(ResourceProxy(resource, partial(self.load_manifest, man_path), partial(self.storage.read_text, man_path)))
             else:
-                resourcelist.append(resource)
+                resourcelist.append(Resource(resource, partial(self.storage.read_text, man_path)))
         return resourcelist
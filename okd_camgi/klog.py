@@ -0,0 +1,158 @@
+'''Parsing of container logs in the klog format used by the autoscaler and machine api controllers.
+
+a klog line looks like this, the year is not recorded:
+
+    I0601 00:00:05.000000       1 scale_down.go:189] Scale-down: removing empty node worker-1
+
+timestamps are kept as the number of microseconds since the start of the (leap) year, and are
+written as "MMDD HH:MM:SS.UUUUUU" like they are in the logs.
+'''
+from array import array
+import re
+
+from okd_camgi import profiling
+
+
+# logs are read in blocks of this size while they are parsed
+READ_SIZE = 4 * 1024 * 1024
+HEADER = re.compile(rb'^([IWEF])(\d\d)(\d\d) (\d\d):(\d\d):(\d\d)\.(\d{6})\s+\d+ ([^\]\s]+)\] ', re.M)
+TIMESTAMP = re.compile(r'^(\d\d)(\d\d) (\d\d):(\d\d)(?::(\d\d)(?:\.(\d{1,6}))?)?$')
+# the autoscaler messages that are collected into the event timeline, with their event kind
+EVENTS = (
+    ('scale-up', re.compile(rb'Scale-up: setting group (?P<group>\S+) size to (?P<size>\d+)')),
+    ('scale-up-plan', re.compile(rb'Final scale-up plan: (?P<plan>.*)')),
+    ('scale-down', re.compile(rb'Scale-down: removing (?:empty )?node (?P<node>[^\s,]+)(?: from group (?P<group>\S+))?')),
+    ('node-group', re.compile(rb'[Nn]ode group (?P<group>\S+) (?P<state>is not ready for scaleup|is not ready for scaledown|has unregistered nodes)')),
+)
+SEVERITIES = {'I': 'info', 'W': 'warning', 'E': 'error', 'F': 'fatal'}
+# days before the start of each month in a leap year, so that february 29 can be represented
+MONTH_DAYS = (0, 0, 31, 60, 91, 121, 152, 182, 213, 244, 274, 305, 335)
+MICROSECONDS_PER_DAY = 24 * 60 * 60 * 10**6
+
+
+def to_microseconds(month, day, hour, minute, second, microsecond):
+    return ((MONTH_DAYS[month] + day - 1) * 24 * 3600 + hour * 3600 + minute * 60 + second) * 10**6 + microsecond
+
+
+def parse_timestamp(text):
+    '''parse a "MMDD HH:MM[:SS[.UUUUUU]]" timestamp into microseconds, raises ValueError if it is not valid'''
+    match = TIMESTAMP.match(text.strip())
+    if match is None:
+        raise ValueError(f'invalid timestamp {text}, the format is MMDD HH:MM:SS.UUUUUU')
+    month, day, hour, minute, second, fraction = match.groups()
+    if not 1 <= int(month) <= 12:
+        raise ValueError(f'invalid timestamp {text}, the month must be between 01 and 12')
+    return to_microseconds(int(month), int(day), int(hour), int(minute), int(second or 0), int((fraction or '0').ljust(6, '0')))
+
+
+def format_timestamp(microseconds):
+    days, remainder = divmod(microseconds, MICROSECONDS_PER_DAY)
+    month = max(m for m in range(1, 13) if MONTH_DAYS[m] <= days)
+    seconds, microsecond = divmod(remainder, 10**6)
+    return f'{month:02d}{days - MONTH_DAYS[month] + 1:02d} {seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}.{microsecond:06d}'
+
+
+class KlogIndex:
+    '''structured records of the klog lines in a log, with an index by time and a timeline of autoscaler events
+
+    the records are kept in arrays, with the offset of each record in the log so that the
+    message is only read when a record is requested. lines that do not start with a klog
+    header are continuations of the message of the record before them.
+    '''
+    def __init__(self, log):
+        self.log = log
+        self.timestamps = array('q')
+        self.severities = bytearray()
+        self.offsets = array('Q')
+        self.source_ids = array('I')
+        self.sources = []
+        self.events = []
+        # the records in time order, this is none when the log is already in time order
+        self.order = None
+
+        with profiling.phase('parse klog'):
+            self._parse()
+            if any(self.timestamps[i] > self.timestamps[i + 1] for i in range(len(self.timestamps) - 1)):
+                self.order = array('I', sorted(range(len(self.timestamps)), key=self.timestamps.__getitem__))
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def record(self, index):
+        '''return the record at an index as a dict'''
+        end = self.offsets[index + 1] if index + 1 < len(self.offsets) else None
+        data = self.log.read(self.offsets[index], end)
+        header = HEADER.match(data)
+        return {
+            'timestamp': format_timestamp(self.timestamps[index]),
+            'severity': SEVERITIES[chr(self.severities[index])],
+            'source': self.sources[self.source_ids[index]],
+            'message': data[header.end() if header else 0:].decode('utf-8', errors='replace').rstrip('\n'),
+        }
+
+    def window(self, start=None, end=None, limit=None):
+        '''return the indices of the records with a timestamp from start up to end, in time order'''
+        first = self._bisect(start) if start is not None else 0
+        last = self._bisect(end) if end is not None else len(self)
+        if limit is not None:
+            last = min(last, first + limit)
+        if self.order is None:
+            return list(range(first, last))
+        return list(self.order[first:last])
+
+    def _bisect(self, timestamp):
+        # the position in time order of the first record at or after timestamp
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            index = self.order[middle] if self.order is not None else middle
+            if self.timestamps[index] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _parse(self):
+        source_ids = {}
+        minutes = {}
+        timestamps, severities, offsets, record_sources = self.timestamps, self.severities, self.offsets, self.source_ids
+        remainder = b''
+        position = 0
+        size = self.log.size
+        for start in range(0, size, READ_SIZE):
+            block = remainder + self.log.read(start, start + READ_SIZE)
+            # the last line may be incomplete, it is parsed with the next block
+            cut = block.rfind(b'\n') + 1 if start + READ_SIZE < size else len(block)
+            block, remainder = block[:cut], block[cut:]
+
+            for match in HEADER.finditer(block):
+                severity, month, day, hour, minute, second, microsecond, source = match.groups()
+                # most lines share their minute with the line before them
+                minute_key = match.group(0)[1:12]
+                if minute_key not in minutes:
+                    minutes[minute_key] = to_microseconds(int(month), int(day), int(hour), int(minute), 0, 0)
+                timestamps.append(minutes[minute_key] + int(second) * 1000000 + int(microsecond))
+                severities.append(severity[0])
+                offsets.append(position + match.start())
+                if source not in source_ids:
+                    source_ids[source] = len(self.sources)
+                    self.sources.append(source.decode('utf-8', errors='replace'))
+                record_sources.append(source_ids[source])
+
+            for kind, pattern in EVENTS:
+                for match in pattern.finditer(block):
+                    line_start = block.rfind(b'\n', 0, match.start()) + 1
+                    header = HEADER.match(block, line_start)
+                    if header is None:
+                        continue
+                    month, day, hour, minute, second, microsecond = (int(g) for g in header.groups()[1:7])
+                    event = {k: v.decode('utf-8', errors='replace') for k, v in match.groupdict().items() if v is not None}
+                    event.update({
+                        'kind': kind,
+                        'timestamp': format_timestamp(to_microseconds(month, day, hour, minute, second, microsecond)),
+                        'offset': position + line_start,
+                    })
+                    self.events.append(event)
+            position += len(block)
+
+        self.events.sort(key=lambda e: (e['timestamp'], e['offset']))
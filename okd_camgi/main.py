@@ -1,23 +1,24 @@
 from argparse import ArgumentParser
 import logging
 import os.path
-import pathlib
-from shutil import unpack_archive
+import posixpath
 import sys
-from tempfile import mkdtemp, TemporaryDirectory
+from tempfile import mkdtemp
 from threading import Thread
 from time import sleep
-import webbrowser
-
-from bottle import route, run
-from jinja2 import Environment, PackageLoader
 
 import okd_camgi
-from okd_camgi.contexts import IndexContext
-from okd_camgi.interfaces import MustGather
+from okd_camgi import profiling
+from okd_camgi.cache import DEFAULT_CACHE_DIR, DiskCache, ParseCache
+from okd_camgi.compiled import CompiledStorage, is_compiled
+from okd_camgi.profiling import Profiler
+from okd_camgi.storage import DirectoryStorage
+
+# the remaining modules are imported where they are used, they are slow to import and
+# are not needed for --help, --version or when the path is not a must-gather.
 
 
-def find_must_gather_root(path):
+def find_must_gather_root(path, storage=None):
     # attempt to determine if the path given is a valid must-gather
     # we do this by looking for a few files which should be present.
     # the rules are as follows:
@@ -25,77 +26,292 @@ def find_must_gather_root(path):
     # 2. look for the directories `namespaces` and `cluster-scoped-resources` in the current path, if they exist return path
     # 3. look to see if there is a single subdirectory in the path, if so run this function on that path and return the result
     # 4. return None
-    if os.path.exists(os.path.join(path, 'version')):
+    # when a storage is given, the path is relative to the root of the storage, otherwise it is a local directory.
+    # each directory is listed once, the storage remembers the types of the entries it lists.
+    if storage is None:
+        storage = DirectoryStorage()
+    if not storage.isdir(path):
+        return None
+    names = storage.listdir(path)
+    if 'version' in names:
         return path
-    if os.path.isdir(os.path.join(path, 'namespaces')) and os.path.isdir(os.path.join(path, 'cluster-scoped-resources')):
+    if 'namespaces' in names and 'cluster-scoped-resources' in names and \
+            storage.isdir(posixpath.join(path, 'namespaces')) and storage.isdir(posixpath.join(path, 'cluster-scoped-resources')):
         return path
 
-    pathfiles = [d for d in pathlib.Path(path).iterdir() if d.is_dir()]
+    pathfiles = [d for d in names if storage.isdir(posixpath.join(path, d))]
     if len(pathfiles) == 1:
-        return find_must_gather_root(str(pathfiles[0]))
+        return find_must_gather_root(posixpath.join(path, pathfiles[0]), storage)
 
     return None
 
 
-def load_index_from_path(path):
-    env = Environment(
-        loader=PackageLoader('okd_camgi', 'templates'),
-        autoescape=False
-    )
+def is_tar_archive(path):
+    # return true if path is a file in one of the tar formats
+    import tarfile
+
+    return os.path.isfile(path) and tarfile.is_tarfile(path)
+
+
+def open_must_gather(path, tar=False):
+    # return the must-gather root directory, or a storage for a tar archive or compiled file,
+    # or None if path does not appear to be a must-gather.
+    if tar:
+        from okd_camgi.interfaces import wanted_member
+        from okd_camgi.storage import TarStorage
+
+        # only the parts of the archive that are used are extracted
+        storage = TarStorage(path, wanted=wanted_member)
+        root = find_must_gather_root('', storage)
+        if root is None:
+            storage.close()
+            return None
+        logging.info(f'Found mg root in {storage.describe(root)}')
+        return storage.subtree(root)
+    if is_compiled(path):
+        return CompiledStorage(path)
+    return find_must_gather_root(path)
+
+
+def setup_caches(path, cache_dir=None):
+    # set up the disk caches used while loading and rendering path, and return the ParseCache.
+    # no caches are used when cache_dir is none, except those in a compiled must-gather.
+    from okd_camgi.contexts import csr_decoder, highlighter
+    from okd_camgi.rendering import enable_bytecode_cache
+
+    cache = None
+    if cache_dir is not None:
+        cache = ParseCache(cache_dir)
+        highlighter.disk_cache = DiskCache('highlight', cache_dir)
+        csr_decoder.disk_cache = DiskCache('csr', cache_dir)
+        enable_bytecode_cache(os.path.join(cache_dir, 'templates'))
+    if isinstance(path, CompiledStorage):
+        # the yaml and csrs were highlighted and decoded when the file was compiled
+        highlighter.disk_cache = path.cache('highlight')
+        csr_decoder.disk_cache = path.cache('csr')
+    return cache
+
+
+def load_index_context(path, jobs=1, cache=None, log_tail_lines=None, decode_csrs=True):
+    # path may be a must-gather directory, or a storage from the storage module
+    # when decode_csrs is false the csrs are decoded when their yaml is first read
+    from okd_camgi.contexts import IndexContext
+    from okd_camgi.interfaces import MustGather
+
+    with profiling.phase('load index context'), MustGather(path, jobs=jobs, cache=cache) as mustgather:
+        index_context = IndexContext(mustgather, log_tail_lines=log_tail_lines, decode_csrs=decode_csrs)
+    return index_context
+
+
+def reload_index_context(index_context, storage, changed, jobs=1, cache=None):
+    # update an index context for the paths that changed, the storage holds the current must-gather files
+    from okd_camgi.interfaces import MustGather
 
-    mustgather = MustGather(path)
+    with profiling.phase('reload index context'), MustGather(storage, jobs=jobs, cache=cache) as mustgather:
+        return index_context.reload(mustgather, changed)
 
-    # render the index.html template
-    index_template = env.get_template('index.html')
-    index_context = IndexContext(mustgather)
-    index_content = index_template.render(index_context.data)
 
-    return index_content
+def watch_must_gather(watcher, storage, on_change):
+    # call on_change with a storage of the current files and the changed paths, each time the must-gather changes.
+    # storage is the one the must-gather was first read from, the changes are relative to it.
+    from okd_camgi.interfaces import SCANNED_PATHS
+    from okd_camgi.watch import watch_changes
+
+    for inventory, changed in watch_changes(watcher, storage.inventory):
+        try:
+            on_change(DirectoryStorage(storage.root, scan=SCANNED_PATHS, inventory=inventory), changed)
+        except Exception as ex:
+            logging.error(f'unable to update for the changes to {storage.root}, {str(ex)}')
+
+
+def load_summary(path, jobs=1, cache=None):
+    # return the summary of the must-gather at path, without highlighting, decoding csrs or reading logs
+    from okd_camgi.contexts import SummaryContext
+    from okd_camgi.interfaces import MustGather
+
+    with profiling.phase('load summary'), MustGather(path, jobs=jobs, cache=cache) as mustgather:
+        return SummaryContext(mustgather).summary()
+
+
+def write_summary(summary, output=None):
+    # write a summary as json to the output filename, or to stdout when there is no output
+    import json
+
+    if output is None:
+        json.dump(summary, sys.stdout, indent=2)
+        print()
+        return
+    with open(output, 'w') as summaryfile:
+        json.dump(summary, summaryfile, indent=2)
+
+
+def index_main(argv):
+    parser = ArgumentParser(prog='okd-camgi index', description='compile a must-gather into a single file that opens quickly')
+    parser.add_argument('path', help='path to the root of must-gather tree')
+    parser.add_argument('-o', '--output', required=True, help='compiled output filename, for example mg.camgi')
+    parser.add_argument('--tar', action='store_true', help='open a must-gather archive in tar format')
+    parser.add_argument('--jobs', type=int, default=1, help='number of worker processes to use when loading manifests')
+    parser.add_argument('--verbose', action='store_true', help='enable verbose logging')
+    args = parser.parse_args(argv)
+
+    if args.verbose:
+        logging.basicConfig(level=logging.DEBUG)
+
+    path = open_must_gather(os.path.abspath(args.path), tar=args.tar)
+    if path is None:
+        logging.error(f'"{os.path.abspath(args.path)}" does not appear to be a valid must-gather archive')
+        sys.exit(1)
+
+    from okd_camgi.compiled import compile_must_gather
+    from okd_camgi.interfaces import SCANNED_PATHS
+
+    storage = DirectoryStorage(path, scan=SCANNED_PATHS) if isinstance(path, str) else path
+    try:
+        compile_must_gather(storage, args.output, jobs=args.jobs)
+    finally:
+        storage.close()
+    print(args.output)
 
 
 def main():
+    # subcommands are given as the first argument, otherwise the argument is a must-gather path
+    if sys.argv[1:2] == ['index']:
+        return index_main(sys.argv[2:])
+    if sys.argv[1:2] == ['batch']:
+        from okd_camgi.batch import batch_main
+
+        return batch_main(sys.argv[2:])
+    if sys.argv[1:2] == ['diff']:
+        from okd_camgi.diff import diff_main
+
+        return diff_main(sys.argv[2:])
+
     parser = ArgumentParser(prog='okd-camgi', description='investigate a must-gather for clues of autoscaler activity')
-    parser.add_argument('path', help='path to the root of must-gather tree')
+    parser.add_argument('path', help='path to the root of must-gather tree, or a file compiled by okd-camgi index')
     parser.add_argument('--tar', action='store_true', help='open a must-gather archive in tar format')
     parser.add_argument('--webbrowser', action='store_true', help='open a webbrowser to investigation')
     parser.add_argument('--server', action='store_true', help='run in server mode')
     parser.add_argument('--host', help='server host address', default='127.0.0.1')
     parser.add_argument('--port', help='server host port', default='8080')
+    parser.add_argument('--server-backend', choices=('threaded', 'waitress', 'cheroot'), default='threaded',
+                        help='http server used in server mode, waitress and cheroot must be installed separately')
+    parser.add_argument('--server-threads', type=int, default=8, help='number of threads handling requests in server mode')
+    parser.add_argument('--debug', action='store_true', help='enable debug mode for the server')
+    parser.add_argument('--collection', action='store_true',
+                        help='in server mode, serve each must-gather directory and archive in the path at /mg/<name>/')
+    parser.add_argument('--watch', action='store_true',
+                        help='watch the must-gather directory, and update the output file or server page as files change')
+    parser.add_argument('--memory-budget', type=int, default=4096,
+                        help='megabytes of memory for the must-gathers loaded by --collection, the least recently used are unloaded beyond it')
     parser.add_argument('--output', help='output filename')
+    parser.add_argument('--format', choices=('html', 'json'), default='html',
+                        help='output an html page, or only a json summary which is written to --output or stdout')
+    parser.add_argument('--jobs', type=int, default=1, help='number of worker processes to use when loading manifests')
+    parser.add_argument('--log-tail-lines', type=int, default=5000, help='number of lines to include from the end of each container log, 0 for all lines')
+    parser.add_argument('--cache-dir', help='directory for the parsed manifest and highlighting caches', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--no-cache', action='store_true', help='disable the parsed manifest and highlighting caches')
+    parser.add_argument('--profile', action='store_true', help='print the time spent in each phase, in server mode add a Server-Timing header to responses')
+    parser.add_argument('--profile-output', help='write cProfile stats to this file')
     parser.add_argument('--version', action='version', version=f'%(prog)s {okd_camgi.version}')
     parser.add_argument('--verbose', action='store_true', help='enable verbose logging')
     args = parser.parse_args()
 
+    if args.format == 'json' and (args.server or args.webbrowser):
+        parser.error('--format json can not be used with --server or --webbrowser')
+    if args.collection and (not args.server or args.output or args.tar or args.format == 'json'):
+        parser.error('--collection requires --server, and can not be used with --output, --tar or --format json')
+    if args.watch and (args.collection or args.tar or args.format == 'json'):
+        parser.error('--watch can not be used with --collection, --tar or --format json')
+
     if args.verbose:
         logging.basicConfig(level=logging.DEBUG)
 
-    path = os.path.abspath(args.path)
-
-    if args.tar:
-        extraction_path = TemporaryDirectory(prefix="okd_camgi")
-        logging.info(f"Trying to unpack mg archive {path} into {extraction_path.name}")
-        unpack_archive(path, extract_dir=extraction_path.name)
-        extracted_mg_content_path = next(filter(lambda x: os.path.isdir(x), os.scandir(extraction_path.name)))
-        extracted_mg_content_path = extracted_mg_content_path.path if extracted_mg_content_path else None
+    if args.collection:
+        # the must-gathers of a collection are opened when they are first requested
+        path = os.path.abspath(args.path)
+        if not os.path.isdir(path):
+            logging.error(f'"{path}" is not a directory')
+            sys.exit(1)
+    else:
+        path = open_must_gather(os.path.abspath(args.path), tar=args.tar)
+        if path is None:
+            logging.error(f'"{os.path.abspath(args.path)}" does not appear to be a valid must-gather archive')
+            sys.exit(1)
 
-        if extracted_mg_content_path:
-            logging.info(f"Found mg root in {extracted_mg_content_path}")
-        else:
-            logging.info(f"No extra dirs was not found in unpacked archive, using {extraction_path}")
+    if args.watch:
+        if not isinstance(path, str):
+            logging.error(f'"{os.path.abspath(args.path)}" is not a must-gather directory, only directories can be watched')
+            sys.exit(1)
+        from okd_camgi.interfaces import SCANNED_PATHS
+        from okd_camgi.watch import open_watcher
 
-        path = extracted_mg_content_path or extraction_path
+        # the watcher is started before the must-gather is read so that no change is missed,
+        # and the storage is kept because the changes are found relative to its inventory.
+        watcher = open_watcher(path, SCANNED_PATHS)
+        path = DirectoryStorage(path, scan=SCANNED_PATHS)
 
-    path = find_must_gather_root(path)
-    if path is not None:
-        content = load_index_from_path(path)
+    if args.format == 'json':
+        # the summary is made from the parsed manifests alone, so only their cache is needed
+        cache = None if args.no_cache else ParseCache(args.cache_dir)
     else:
-        logging.error(f'"{os.path.abspath(args.path)}" does not appear to be a valid must-gather archive')
-        sys.exit(1)
+        from okd_camgi.rendering import stream_index, write_index
+
+        cache = setup_caches(path, None if args.no_cache else args.cache_dir)
+
+    profiler = Profiler()
+    cprofile = None
+    if args.profile_output:
+        import cProfile
+
+        cprofile = cProfile.Profile()
+        cprofile.enable()
+
+    with profiling.recording(profiler if args.profile else None):
+        if args.format == 'json':
+            summary = load_summary(path, jobs=args.jobs, cache=cache)
+            with profiling.phase('write'):
+                write_summary(summary, args.output)
+
+        elif args.collection:
+            from okd_camgi.server import Collection, IndexCache
+
+            def open_index(mgpath):
+                # return an IndexCache for a must-gather of the collection, or None if it is not one
+                opened = open_must_gather(mgpath, tar=is_tar_archive(mgpath))
+                if opened is None:
+                    return None
+                return IndexCache(opened, lambda: load_index_context(opened, jobs=args.jobs, cache=cache, log_tail_lines=args.log_tail_lines, decode_csrs=False),
+                                  lambda ctx: stream_index(ctx, lazy=True))
 
-    if args.output or not args.server:
-        indexpath = args.output if args.output else os.path.join(mkdtemp(), 'index.html')
-        with open(indexpath, 'w') as indexfile:
-            indexfile.write(content)
+            index = Collection(path, open_index, budget=args.memory_budget * 1024**2)
+
+        elif args.server:
+            from okd_camgi.server import IndexCache
+
+            # in server mode the rendered page is cached until the must-gather changes,
+            # the page is rendered without yaml and logs which are fetched on demand.
+            # when watching, only the parts of the context for the changed files are updated.
+            reload = None
+            if args.watch:
+                reload = lambda ctx, storage, changed: reload_index_context(ctx, storage, changed, jobs=args.jobs, cache=cache)
+            index = IndexCache(path, lambda: load_index_context(path, jobs=args.jobs, cache=cache, log_tail_lines=args.log_tail_lines, decode_csrs=False),
+                               lambda ctx: stream_index(ctx, lazy=True, watch=args.watch), reload)
+            index.content()
+
+        if args.format == 'html' and (args.output or not args.server):
+            index_context = index.context() if args.server else load_index_context(path, jobs=args.jobs, cache=cache, log_tail_lines=args.log_tail_lines)
+            indexpath = args.output if args.output else os.path.join(mkdtemp(), 'index.html')
+            # the page is written as it is rendered, so it is never held in memory in full
+            write_index(index_context, indexpath)
+
+    if cprofile is not None:
+        cprofile.disable()
+        cprofile.dump_stats(args.profile_output)
+        logging.info(f'wrote profile stats to {args.profile_output}')
+    if args.profile:
+        print(profiler.summary(), file=sys.stderr)
+    if args.format == 'json':
+        return
 
     host = args.host
     port = int(args.port)
@@ -106,19 +322,39 @@ def main():
     if args.webbrowser:
         # delay opening the browser in case we are running in server mode
         def delay_browser_open():
+            import webbrowser
+
             sleep(1)
             webbrowser.open(url)
 
         bth = Thread(target=delay_browser_open)
         bth.start()
 
+    if args.watch:
+        def on_change(storage, changed):
+            if args.server:
+                # the browsers showing the page are told to reload it
+                index.refresh(storage, changed)
+            else:
+                reload_index_context(index_context, storage, changed, jobs=args.jobs, cache=cache)
+            if args.output or not args.server:
+                # the page is written beside the output and then moved over it, so it is never read half written
+                write_index(index_context, f'{indexpath}.tmp')
+                os.replace(f'{indexpath}.tmp', indexpath)
+                logging.info(f'updated {indexpath}')
+
     if args.server:
-        @route('/')
-        def handler():
-            content = load_index_from_path(path)
-            return content
+        from okd_camgi.server import serve
 
-        run(host=host, port=port, debug=True)
+        if args.watch:
+            Thread(target=watch_must_gather, args=(watcher, path, on_change), name='okd-camgi-watch', daemon=True).start()
+        serve(index, host=host, port=port, profile=args.profile, backend=args.server_backend,
+              threads=args.server_threads, debug=args.debug)
+    elif args.watch:
+        try:
+            watch_must_gather(watcher, path, on_change)
+        except KeyboardInterrupt:
+            pass
 
     if bth is not None:
         bth.join()
@@ -0,0 +1,76 @@
+'''Timing instrumentation for the phases of processing a must gather.
+
+phases are recorded into the profiler that is active in the current thread, when no
+profiler is active the phase function does nothing.
+'''
+from contextlib import contextmanager
+from threading import local
+import time
+
+try:
+    import resource
+except ImportError:
+    # resource is only on unix, the peak rss is not recorded elsewhere
+    resource = None
+
+
+_local = local()
+
+
+class Profiler:
+    '''records the wall time, cpu time and peak rss of named phases, the peak rss is none where it is not known'''
+    def __init__(self):
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name):
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            stats = self.phases.setdefault(name, {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'peak_rss_kb': None})
+            stats['calls'] += 1
+            stats['wall'] += time.perf_counter() - wall
+            stats['cpu'] += time.thread_time() - cpu
+            if resource is not None:
+                # ru_maxrss is the peak for the whole process so far, in kilobytes on linux
+                stats['peak_rss_kb'] = max(stats['peak_rss_kb'] or 0, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+    def summary(self):
+        '''return a table of the phases as a string'''
+        lines = [f'{"phase":<48}{"calls":>8}{"wall s":>10}{"cpu s":>10}{"peak rss MB":>14}']
+        for name, stats in self.phases.items():
+            rss = f'{stats["peak_rss_kb"] / 1024:.1f}' if stats['peak_rss_kb'] is not None else '-'
+            lines.append(f'{name:<48}{stats["calls"]:>8}{stats["wall"]:>10.3f}{stats["cpu"]:>10.3f}{rss:>14}')
+        return '\n'.join(lines)
+
+    def server_timing(self):
+        '''return the phases formatted for a Server-Timing http header'''
+        metrics = []
+        for name, stats in self.phases.items():
+            token = ''.join(c if c.isalnum() or c in '-_.' else '-' for c in name)
+            metrics.append(f'{token};dur={stats["wall"] * 1000:.1f};desc="{name}"')
+        return ', '.join(metrics)
+
+
+@contextmanager
+def recording(profiler):
+    '''make a profiler active in the current thread'''
+    previous = getattr(_local, 'profiler', None)
+    _local.profiler = profiler
+    try:
+        yield profiler
+    finally:
+        _local.profiler = previous
+
+
+@contextmanager
+def phase(name):
+    '''record a phase in the active profiler, if there is one'''
+    profiler = getattr(_local, 'profiler', None)
+    if profiler is None:
+        yield
+        return
+    with profiler.phase(name):
+        yield
@@ -0,0 +1,33 @@
+'''Parsing of kubernetes resource quantities, such as "3500m" or "16Gi".'''
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+
+
+# the power of the base for each suffix, binary suffixes end with "i"
+DECIMAL_SUFFIXES = {'n': -3, 'u': -2, 'm': -1, 'k': 1, 'M': 2, 'G': 3, 'T': 4, 'P': 5, 'E': 6}
+BINARY_SUFFIXES = {'Ki': 1, 'Mi': 2, 'Gi': 3, 'Ti': 4, 'Pi': 5, 'Ei': 6}
+
+
+# the same few quantities repeat across all the nodes of a machineset, so the results are memoized
+@lru_cache(maxsize=1024)
+def parse_quantity(quantity):
+    '''parse a kubernetes quantity into a Decimal, raises ValueError if the quantity is not valid'''
+    if isinstance(quantity, (int, float, Decimal)):
+        return Decimal(quantity)
+
+    quantity = str(quantity).strip()
+    if quantity[-2:] in BINARY_SUFFIXES:
+        number, base, exponent = quantity[:-2], 1024, BINARY_SUFFIXES[quantity[-2:]]
+    elif quantity[-1:] in DECIMAL_SUFFIXES:
+        number, base, exponent = quantity[:-1], 1000, DECIMAL_SUFFIXES[quantity[-1:]]
+    else:
+        number, base, exponent = quantity, 1000, 0
+
+    try:
+        value = Decimal(number)
+    except InvalidOperation:
+        raise ValueError(f'invalid quantity {quantity}')
+    # Decimal accepts nan and infinity, which are not valid quantities
+    if not value.is_finite():
+        raise ValueError(f'invalid quantity {quantity}')
+    return value * (Decimal(base) ** exponent)
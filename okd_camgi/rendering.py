@@ -0,0 +1,55 @@
+'''Rendering of the index page from its context.'''
+import os
+
+from jinja2 import Environment, FileSystemBytecodeCache, PackageLoader
+
+from okd_camgi import profiling
+
+
+# the environment is shared so that the compiled templates are reused between renders
+environment = Environment(
+    loader=PackageLoader('okd_camgi', 'templates'),
+    autoescape=False
+)
+
+# the number of pieces of template output joined into each chunk of a streamed page
+STREAM_BUFFER_SIZE = 64
+# the buffer size of the file the page is written to
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+def enable_bytecode_cache(path):
+    '''store the compiled templates in path, so they are not recompiled by later runs'''
+    os.makedirs(path, exist_ok=True)
+    environment.bytecode_cache = FileSystemBytecodeCache(path)
+
+
+def stream_index(index_context, lazy=False, watch=False):
+    '''return an iterator over the rendered page in chunks of text, the whole page is never held in memory
+
+    when watch is true the page reloads itself when the server has rebuilt it.
+    '''
+    stream = environment.get_template('index.html').stream(index_context.data, lazy=lazy, watch=watch)
+    # join the many small pieces of template output into larger chunks
+    stream.enable_buffering(STREAM_BUFFER_SIZE)
+    return stream
+
+
+def write_index(index_context, path, lazy=False):
+    '''render the page into the file at path as it is generated'''
+    with profiling.phase('render'), open(path, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE) as indexfile:
+        stream_index(index_context, lazy=lazy).dump(indexfile)
+
+
+def render_index(index_context, lazy=False):
+    # when lazy is true the yaml and logs are not included in the page, they are fetched from the server api
+    with profiling.phase('render'):
+        index_template = environment.get_template('index.html')
+        index_content = index_template.render(index_context.data, lazy=lazy)
+
+    return index_content
+
+
+def render_collection(mustgathers, used, budget):
+    '''render the page listing the must gathers of a collection, used and budget are in bytes'''
+    return environment.get_template('collection.html').render(mustgathers=mustgathers, used=used, budget=budget)
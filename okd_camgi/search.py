@@ -0,0 +1,159 @@
+'''Full text search of the container logs in a must gather.'''
+from array import array
+from itertools import groupby
+import logging
+import re
+import sys
+from threading import Lock, Thread
+
+from okd_camgi import profiling
+
+
+# logs are read in blocks of this size while they are indexed
+READ_SIZE = 4 * 1024 * 1024
+# the words that lines are indexed by, matched in the lower case text of a line
+WORD = re.compile(rb'[a-z0-9_]+')
+# the bytes held by the postings of a word before any lines are added to them
+EMPTY_POSTINGS_SIZE = sys.getsizeof(array('I'))
+
+
+def words(text):
+    '''return the set of indexed words in some bytes of text'''
+    return set(WORD.findall(text.lower()))
+
+
+class LogIndex:
+    '''inverted index from the words in container log lines to the lines that contain them
+
+    logs are added one at a time, and can be searched while more are being added. the
+    text of the lines is not kept, it is read back from the logs for matching lines.
+    '''
+    def __init__(self):
+        self.logs = []
+        # the log, line number and offset of each line, indexed by line id
+        self._line_log = array('I')
+        self._line_number = array('I')
+        self._line_offset = array('Q')
+        self._postings = {}
+        # an estimate of the bytes held by the index, updated as logs are added
+        self._size = 0
+        self._lock = Lock()
+
+    def add(self, key, log):
+        '''index the lines of a log, key is a tuple of (namespace, pod, container) identifying the log'''
+        with profiling.phase('index log'):
+            numbers = array('I')
+            offsets = array('Q')
+            postings = {}
+            number = 0
+            position = 0
+            remainder = b''
+            for block in log.blocks(size=READ_SIZE):
+                lines = (remainder + block).split(b'\n')
+                # the last piece is an incomplete line, it is continued by the next block
+                remainder = lines.pop()
+                for line in lines:
+                    self._add_line(postings, numbers, offsets, line, number, position)
+                    number += 1
+                    position += len(line) + 1
+            if remainder:
+                self._add_line(postings, numbers, offsets, remainder, number, position)
+
+        with self._lock:
+            log_id = len(self.logs)
+            first = len(self._line_log)
+            self.logs.append((key, log))
+            self._line_log.extend(array('I', [log_id]) * len(numbers))
+            self._line_number.extend(numbers)
+            self._line_offset.extend(offsets)
+            self._size += len(numbers) * (self._line_log.itemsize + numbers.itemsize + offsets.itemsize)
+            for word, lines in postings.items():
+                if word not in self._postings:
+                    self._postings[word] = array('I')
+                    self._size += sys.getsizeof(word) + EMPTY_POSTINGS_SIZE
+                self._postings[word].extend(first + i for i in lines)
+                self._size += len(lines) * self._postings[word].itemsize
+
+    def size(self):
+        '''return an estimate of the bytes held by the index, the logs themselves are not included'''
+        return self._size
+
+    def search(self, query, limit=100):
+        '''return up to limit (key, line number, text) tuples for the lines containing the query, ignoring case
+
+        the lines are found by the words of the query, so the words must be complete.
+        '''
+        query = query.lower()
+        query_words = words(query.encode())
+        if not query_words:
+            return []
+        with self._lock:
+            postings = [self._postings.get(w, ()) for w in query_words]
+            postings.sort(key=len)
+            candidates = set(postings[0])
+            for lines in postings[1:]:
+                candidates.intersection_update(lines)
+            candidates = sorted(candidates)
+            logs = list(self.logs)
+            lines = []
+            for c in candidates:
+                log_id = self._line_log[c]
+                # the line ends where the next line of the same log starts
+                end = self._line_offset[c + 1] if c + 1 < len(self._line_log) and self._line_log[c + 1] == log_id else None
+                lines.append((log_id, self._line_number[c], self._line_offset[c], end))
+
+        results = []
+        # the candidates are in order of their log, so each log is opened once for all its lines
+        for log_id, log_lines in groupby(lines, key=lambda line: line[0]):
+            key, log = logs[log_id]
+            with log.buffer() as buf:
+                for _, number, offset, end in log_lines:
+                    # the words matched, check that the whole query is in the line
+                    text = bytes(buf[offset:end]).decode('utf-8', errors='replace').rstrip('\n')
+                    if query in text.lower():
+                        results.append((key, number, text))
+                        if len(results) >= limit:
+                            return results
+        return results
+
+    @staticmethod
+    def _add_line(postings, numbers, offsets, line, number, position):
+        line_id = len(numbers)
+        numbers.append(number)
+        offsets.append(position)
+        for word in words(line):
+            postings.setdefault(word, []).append(line_id)
+
+
+class BackgroundLogIndex(LogIndex):
+    '''LogIndex that adds the logs of a list of pod contexts in a background thread'''
+    def __init__(self, pods):
+        super().__init__()
+        self.total = sum(len(pod['containerlogs']) for pod in pods)
+        # true once every log has been added
+        self.complete = False
+        self._stopped = False
+        self._thread = Thread(target=self._build, args=(pods,), name='okd-camgi-log-index', daemon=True)
+        self._thread.start()
+
+    def stop(self, wait=False):
+        '''stop adding logs, the logs already added can still be searched
+
+        when wait is true this returns once the log being added, if any, is done.
+        '''
+        self._stopped = True
+        if wait:
+            self._thread.join()
+
+    def _build(self, pods):
+        for pod in pods:
+            for containerlog in pod['containerlogs']:
+                if self._stopped:
+                    return
+                key = (pod['metadata'].get('namespace'), pod['metadata']['name'], containerlog['name'])
+                try:
+                    self.add(key, containerlog['log'])
+                except Exception as ex:
+                    logging.error(f'unable to index log {"/".join(key)}, {str(ex)}')
+        self.complete = True
+        logging.info(f'indexed {len(self.logs)} container logs')
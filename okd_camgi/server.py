@@ -0,0 +1,735 @@
+'''Server mode for serving a must gather investigation over http.'''
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import gzip
+import hashlib
+import logging
+import os
+from threading import Lock
+import time
+import zlib
+from wsgiref.simple_server import WSGIServer
+
+from bottle import abort, http_date, HTTPResponse, install, json_dumps, parse_date, parse_range_header, redirect, request, response, route, run, WSGIRefServer
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+import okd_camgi
+from okd_camgi import klog, profiling
+from okd_camgi.batch import ARCHIVE_SUFFIXES, report_name
+from okd_camgi.interfaces import MustGather
+from okd_camgi.profiling import Profiler
+from okd_camgi.search import BackgroundLogIndex
+
+
+# the size of the chunks used when sending whole logs
+LOG_CHUNK_SIZE = 1024 * 1024
+# the number of lines in a page of logs when no count is given
+LOG_PAGE_LINES = 1000
+# the number of lines returned by a log search when no limit is given
+SEARCH_LIMIT = 100
+# the number of klog records returned when no limit is given
+KLOG_LIMIT = 1000
+# responses smaller than this are not compressed
+COMPRESS_MIN_SIZE = 1024
+# the supported content encodings, in order of preference
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+# the number of worker threads handling requests when no number is given
+DEFAULT_THREADS = 8
+# the server backends that can be chosen, and the name of their option for the number of threads
+BACKENDS = {'threaded': 'threads', 'waitress': 'threads', 'cheroot': 'numthreads'}
+# how long the fingerprint of a must gather is trusted before it is taken again, in seconds
+FINGERPRINT_SECONDS = 2
+# the memory budget of a Collection when no budget is given, in bytes
+DEFAULT_MEMORY_BUDGET = 4 * 1024**3
+# the request environ key of the functions that release what a request used, they are called by the releasing plugin
+RELEASE_KEY = 'okd_camgi.release'
+
+
+IndexState = namedtuple('IndexState', ['context', 'content', 'etag', 'modified'])
+LoadedIndex = namedtuple('LoadedIndex', ['index', 'path', 'size'])
+
+
+class IndexCache:
+    '''cache of the index context and rendered page, they are rebuilt only when the must gather fingerprint changes
+
+    load is a function returning an IndexContext, render is a function taking the context and returning the
+    page as an iterable of text chunks. the page is kept as a tuple of utf-8 encoded chunks.
+
+    reload is a function taking the context, a storage of the current files and a list of the paths that
+    changed, which updates the context in place. when it is given the must gather is watched for changes,
+    so it is not fingerprinted on each request, and the page is only rebuilt when refresh is called.
+    otherwise the must gather is fingerprinted at most once every FINGERPRINT_SECONDS.
+    '''
+    def __init__(self, path, load, render, reload=None):
+        self.path = path
+        self._load = load
+        self._render = render
+        self._reload = reload
+        self._lock = Lock()
+        self._fingerprint = None
+        # the time.monotonic of the last fingerprint
+        self._checked = None
+        self._inventory = None
+        self._state = None
+        self._encoded = {}
+        self._search_lock = Lock()
+        self._search_state = None
+        self._search_index = None
+
+    def context(self):
+        return self.state().context
+
+    def content(self):
+        return self.state().content
+
+    def state(self, check=True):
+        '''return the current IndexState, rebuilding it if the must gather has changed
+
+        when check is false the current state is returned without looking for changes, once there is one.
+        '''
+        with self._lock:
+            if self._state is not None:
+                if self._reload is not None or not check or time.monotonic() - self._checked < FINGERPRINT_SECONDS:
+                    return self._state
+        checked = time.monotonic()
+        with profiling.phase('fingerprint'):
+            mustgather = MustGather(self.path)
+            fingerprint = mustgather.fingerprint()
+        # only directories have an inventory, it is used to report what changed
+        inventory = getattr(mustgather.storage, 'inventory', None)
+        # requests that arrive during a rebuild wait here, and then find the fresh content
+        with self._lock:
+            if self._state is None or fingerprint != self._fingerprint:
+                if self._inventory is not None and inventory is not None:
+                    added, removed, modified = inventory.diff(self._inventory)
+                    logging.info(f'{self.path} changed, {len(added)} files added, {len(removed)} removed, {len(modified)} modified')
+                logging.info(f'rendering index for {self.path} with fingerprint {fingerprint}')
+                self._render_state(self._load())
+                self._fingerprint = fingerprint
+                self._inventory = inventory
+            self._checked = checked
+            return self._state
+
+    def refresh(self, storage, changed):
+        '''update the context for the paths that changed in a storage of the current files, and render the page again'''
+        with self._lock:
+            if self._state is None:
+                return
+            with profiling.phase('reload'):
+                self._reload(self._state.context, storage, changed)
+            self._render_state(self._state.context)
+            self._inventory = storage.inventory
+
+    def _render_state(self, context):
+        # render the page of a context into a new state, the lock must be held
+        digest = hashlib.sha1()
+        content = []
+        with profiling.phase('render'):
+            for chunk in self._render(context):
+                chunk = chunk.encode()
+                digest.update(chunk)
+                content.append(chunk)
+        content = tuple(content)
+        # the etag is weak so that it is the same for every content encoding
+        etag = f'W/"{okd_camgi.version}-{digest.hexdigest()}"'
+        self._state = IndexState(context, content, etag, time.time())
+        self._encoded = {}
+
+    def encoded(self, state, encoding):
+        '''return the content chunks of a state compressed with encoding, the result is kept until the next rebuild'''
+        with self._lock:
+            if state is self._state and encoding in self._encoded:
+                return self._encoded[encoding]
+        body = tuple(c for c in compress_chunks(state.content, encoding) if c)
+        with self._lock:
+            if state is self._state:
+                self._encoded[encoding] = body
+        return body
+
+    def size(self):
+        '''return the number of bytes held by the rendered page, its compressed copies and the search index'''
+        with self._lock:
+            if self._state is None:
+                return 0
+            size = sum(len(c) for body in (self._state.content, *self._encoded.values()) for c in body)
+        return size + self.search_size()
+
+    def search_size(self):
+        '''return an estimate of the bytes held by the search index, it grows while the logs are indexed'''
+        with self._search_lock:
+            return self._search_index.size() if self._search_index is not None else 0
+
+    def search_index(self, state):
+        '''return the BackgroundLogIndex of the container logs of a state, it is started on the first call'''
+        with self._search_lock:
+            if self._search_state is not state:
+                if self._search_index is not None:
+                    self._search_index.stop()
+                self._search_index = BackgroundLogIndex(state.context['mapipods'] + state.context['mcopods'])
+                self._search_state = state
+            return self._search_index
+
+    def close(self):
+        '''stop the search index and close the storage of the must gather, the cache must not be used after'''
+        with self._search_lock:
+            search_index = self._search_index
+        if search_index is not None:
+            # the index may be reading a log, it is waited for so the storage is not closed under it
+            search_index.stop(wait=True)
+        if not isinstance(self.path, str):
+            self.path.close()
+
+
+class Collection:
+    '''the must gathers in a directory, each served at /mg/<name>/
+
+    the entries of the directory are must gather directories, tar archives and compiled files.
+    each is opened and loaded on first access, and the loaded IndexCaches are kept in least
+    recently used order. when their total size is over the memory budget the least recently
+    used are evicted, they are loaded again when they are next accessed. requests hold an
+    IndexCache between acquire and release, an evicted one is closed when it is last released.
+
+    open_index is a function taking the filesystem path of an entry and returning an IndexCache,
+    or none if the entry is not a must gather. budget is in bytes.
+    '''
+    def __init__(self, root, open_index, budget=DEFAULT_MEMORY_BUDGET):
+        self.root = root
+        self.budget = budget
+        self._open_index = open_index
+        self._lock = Lock()
+        # a lock for each entry name, held while it is loaded, so that different entries load at once
+        self._load_locks = {}
+        # the number of loads in progress, and the number started, to tell if a load overlapped others
+        self._loading = 0
+        self._loads = 0
+        self._loaded = OrderedDict()
+        # the largest size measured for each path, it is reused when an evicted entry is loaded again
+        self._sizes = {}
+        # the number of requests using each IndexCache, and the evicted ones to close when they are released
+        self._users = {}
+        self._retired = {}
+
+    def entries(self):
+        '''return a dict of entry name to filesystem path, in sorted order'''
+        used = set()
+        entries = {}
+        for filename in sorted(os.listdir(self.root)):
+            path = os.path.join(self.root, filename)
+            if filename.startswith('.'):
+                continue
+            if os.path.isdir(path) or (filename.endswith(ARCHIVE_SUFFIXES) and os.path.isfile(path)):
+                entries[report_name(path, used)] = path
+        return entries
+
+    def loaded(self):
+        '''return a dict of the names of the loaded entries to their estimated size in bytes, least recently used first'''
+        with self._lock:
+            return {name: self._size(loaded) for name, loaded in self._loaded.items()}
+
+    def acquire(self, name):
+        '''return the IndexCache of an entry, loading it if needed, or none if there is no must gather by that name
+
+        the IndexCache is not closed while it is in use, release must be called with it once the caller is done.
+        '''
+        index = self._lookup(name)
+        if index is not None:
+            return index
+        path = self.entries().get(name)
+        if path is None:
+            return None
+        with self._lock:
+            load_lock = self._load_locks.setdefault(name, Lock())
+        with load_lock:
+            # another request may have loaded the entry while this one waited
+            index = self._lookup(name)
+            if index is not None:
+                return index
+            with self._lock:
+                overlapped = self._loading > 0
+                self._loading += 1
+                self._loads += 1
+                loads = self._loads
+            try:
+                before = resident_memory()
+                with profiling.phase('load must-gather'):
+                    index = self._open_index(path)
+                    if index is None:
+                        return None
+                    try:
+                        index.state()
+                    except Exception:
+                        index.close()
+                        raise
+                growth = resident_memory() - before
+            finally:
+                with self._lock:
+                    self._loading -= 1
+                    overlapped = overlapped or self._loads != loads
+            # the growth of the process is a better estimate than the page alone, but it is not known on every
+            # platform, it is too low when memory freed by an earlier eviction is reused, and it includes the
+            # memory of other entries when they were loaded at the same time.
+            with self._lock:
+                size = max(0 if overlapped else growth, index.size(), self._sizes.get(path, 0))
+                self._sizes[path] = size
+                self._loaded[name] = LoadedIndex(index, path, size)
+                self._users[index] = 1
+                evicted = self._evict(keep=name)
+            self._close(evicted)
+            logging.info(f'loaded {path} as {name}, using about {size // 1024**2}MB')
+        return index
+
+    def release(self, index):
+        '''mark an IndexCache returned by acquire as no longer used by the caller'''
+        with self._lock:
+            self._users[index] -= 1
+            if self._users[index] > 0:
+                return
+            del self._users[index]
+            retired = self._retired.pop(index, None)
+        if retired is not None:
+            self._close([retired])
+
+    def _lookup(self, name):
+        # return a loaded index and mark it as the most recently used, or none if it is not loaded
+        with self._lock:
+            loaded = self._loaded.get(name)
+            if loaded is None:
+                return None
+            self._loaded.move_to_end(name)
+            self._users[loaded.index] = self._users.get(loaded.index, 0) + 1
+            # the search indexes grow after they are loaded, so the budget is checked on each access
+            evicted = self._evict(keep=name)
+        self._close(evicted)
+        return loaded.index
+
+    def _evict(self, keep):
+        # evict the least recently used indexes until the loaded ones fit in the budget, keep is never evicted.
+        # returns the evicted entries that are not in use, they are closed by the caller once the lock is
+        # released. those in use are retired, and closed when they are released.
+        sizes = {name: self._size(loaded) for name, loaded in self._loaded.items()}
+        total = sum(sizes.values())
+        evicted = []
+        for name in list(self._loaded):
+            if total <= self.budget:
+                break
+            if name == keep:
+                continue
+            loaded = self._loaded.pop(name)
+            total -= sizes[name]
+            if loaded.index in self._users:
+                self._retired[loaded.index] = loaded
+            else:
+                evicted.append(loaded)
+            logging.info(f'evicted {loaded.path}, {total // 1024**2}MB of {self.budget // 1024**2}MB in use')
+        return evicted
+
+    @staticmethod
+    def _close(evicted):
+        # close the storage of evicted entries, so that their temporary files and connections are released
+        for loaded in evicted:
+            try:
+                loaded.index.close()
+            except Exception as ex:
+                logging.error(f'unable to close {loaded.path}, {str(ex)}')
+
+    @staticmethod
+    def _size(loaded):
+        # the size measured when an entry was loaded, and its search index which is built later
+        return loaded.size + loaded.index.search_size()
+
+
+class PooledWSGIServer(WSGIServer):
+    '''wsgiref server that handles requests with a pool of worker threads'''
+    threads = DEFAULT_THREADS
+
+    def __init__(self, *args, **kwargs):
+        # the pool is made first, server_close is called when binding the socket fails and shuts it down
+        self._pool = ThreadPoolExecutor(self.threads, thread_name_prefix='okd-camgi-server')
+        super().__init__(*args, **kwargs)
+
+    def process_request(self, request, client_address):
+        self._pool.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=False)
+
+
+class ThreadedServer(WSGIRefServer):
+    '''bottle server adapter for the wsgiref server with a pool of worker threads'''
+    def run(self, app):
+        threads = self.options.pop('threads', DEFAULT_THREADS)
+        self.options['server_class'] = type('PooledWSGIServer', (PooledWSGIServer,), {'threads': threads})
+        super().run(app)
+
+
+def resident_memory():
+    '''return the resident memory of this process in bytes, or 0 where it can not be read'''
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def accepted_encoding(header):
+    '''return the preferred supported encoding from an Accept-Encoding header, or None'''
+    accepted = {}
+    for item in header.split(','):
+        name, _, params = item.partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in ENCODINGS:
+        if accepted.get(encoding, accepted.get('*', 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6)
+
+
+def compress_chunks(chunks, encoding):
+    '''yield the compressed form of an iterable of bytes chunks, as one stream'''
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=5)
+        for chunk in chunks:
+            yield compressor.process(chunk)
+        yield compressor.finish()
+        return
+    # a wbits of 31 writes the gzip header and trailer
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        yield compressor.compress(chunk)
+    yield compressor.flush()
+
+
+def not_modified(etag, modified):
+    '''set the cache validators on the response, returns True if the copy held by the client is current'''
+    response.set_header('ETag', etag)
+    response.set_header('Last-Modified', http_date(modified))
+    # clients may keep the responses, but must revalidate them before use
+    response.set_header('Cache-Control', 'no-cache')
+    if_none_match = request.environ.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        tags = [t.strip() for t in if_none_match.split(',')]
+        return '*' in tags or etag in tags or etag.removeprefix('W/') in tags
+    if_modified_since = parse_date(request.environ.get('HTTP_IF_MODIFIED_SINCE', '').split(';')[0].strip())
+    return if_modified_since is not None and int(modified) <= if_modified_since
+
+
+def compression(callback):
+    '''bottle plugin that compresses text responses when the client accepts it'''
+    def wrapper(*args, **kwargs):
+        body = callback(*args, **kwargs)
+        if response.status_code != 200 or 'Content-Encoding' in response.headers:
+            return body
+        if isinstance(body, dict):
+            # the json plugin is applied outside this one, so dicts are serialized here to be compressed
+            body = json_dumps(body)
+            response.content_type = 'application/json'
+        if not isinstance(body, (str, bytes)) or len(body) < COMPRESS_MIN_SIZE:
+            return body
+        response.set_header('Vary', 'Accept-Encoding')
+        encoding = accepted_encoding(request.environ.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return body
+        response.set_header('Content-Encoding', encoding)
+        return compress(body.encode() if isinstance(body, str) else body, encoding)
+    return wrapper
+
+
+def releasing(callback):
+    '''bottle plugin that calls the functions added to the RELEASE_KEY list of the request environ once the response
+    is sent, the body of a streamed response is sent after the callback returns.
+    '''
+    def release():
+        for func in request.environ.pop(RELEASE_KEY, ()):
+            func()
+
+    def released(body, funcs):
+        # the server closes the body when the client goes away, which also ends this generator
+        try:
+            yield from body
+        finally:
+            for func in funcs:
+                func()
+
+    def wrapper(*args, **kwargs):
+        try:
+            body = callback(*args, **kwargs)
+        except BaseException:
+            release()
+            raise
+        if hasattr(body, '__next__') and RELEASE_KEY in request.environ:
+            return released(body, request.environ.pop(RELEASE_KEY))
+        release()
+        return body
+    return wrapper
+
+
+def server_timing(callback):
+    '''bottle plugin that profiles each request and returns the phases in a Server-Timing header'''
+    def wrapper(*args, **kwargs):
+        profiler = Profiler()
+        with profiling.recording(profiler), profiler.phase('total'):
+            body = callback(*args, **kwargs)
+        response.set_header('Server-Timing', profiler.server_timing())
+        return body
+    return wrapper
+
+
+def serve(index, host, port, profile=False, backend='threaded', threads=DEFAULT_THREADS, debug=False):
+    '''serve the index page and api from an IndexCache, or from each must gather of a Collection at /mg/<name>/
+
+    backend is one of the BACKENDS, the waitress and cheroot backends must be installed separately.
+    '''
+    install(compression)
+    if profile:
+        install(server_timing)
+
+    if isinstance(index, Collection):
+        install(releasing)
+        collection_routes(index)
+    else:
+        index_routes('', lambda mg: index)
+        # start indexing as soon as the server starts, instead of on the first search
+        index.search_index(index.state())
+
+    server = ThreadedServer if backend == 'threaded' else backend
+    run(host=host, port=port, server=server, debug=debug, **{BACKENDS[backend]: threads})
+
+
+def collection_routes(collection):
+    '''add the routes of the collection page, and of the page and api of each must gather below /mg/<name>/'''
+    from okd_camgi.rendering import render_collection
+
+    def lookup(mg):
+        '''return the IndexCache of a must gather, loading it if needed, or respond with 404 if it is not found
+
+        the IndexCache is released by the releasing plugin once the response has been sent.
+        '''
+        try:
+            index = collection.acquire(mg)
+        except Exception as ex:
+            logging.error(f'unable to load must-gather {mg}, {str(ex)}')
+            abort(500, f'unable to load must-gather {mg}, {str(ex)}')
+        if index is None:
+            abort(404, f'must-gather {mg} not found')
+        request.environ.setdefault(RELEASE_KEY, []).append(partial(collection.release, index))
+        return index
+
+    def entries():
+        loaded = collection.loaded()
+        return [{'name': name, 'filename': os.path.basename(path), 'loaded': name in loaded, 'size': loaded.get(name)}
+                for name, path in collection.entries().items()]
+
+    @route('/')
+    def collection_page():
+        loaded = collection.loaded()
+        return render_collection(entries(), used=sum(loaded.values()), budget=collection.budget)
+
+    @route('/api/collection')
+    def collection_api():
+        '''return the must gathers of the collection, and the memory used by those that are loaded, as json'''
+        loaded = collection.loaded()
+        return {'budget': collection.budget, 'used': sum(loaded.values()), 'mustgathers': entries()}
+
+    @route('/mg/<mg>')
+    def collection_redirect(mg):
+        # the page fetches the api with relative urls, so it must be served with a trailing slash
+        redirect(f'{mg}/')
+
+    index_routes('/mg/<mg>', lookup)
+
+
+def index_routes(prefix, lookup):
+    '''add the routes of the index page and api below prefix, lookup is a function returning the IndexCache
+
+    lookup is called with the mg wildcard of the prefix, or none when the prefix has no wildcard.
+    '''
+    def current(index, check=False):
+        '''return the current IndexState of an IndexCache, or respond with 304 if the client copy is current
+
+        only the page checks the must gather for changes, the api serves the state the page was built from.
+        '''
+        state = index.state(check)
+        if not_modified(state.etag, state.modified):
+            raise HTTPResponse(status=304, headers=dict(response.headers))
+        return state
+
+    @route(prefix + '/')
+    def handler(mg=None):
+        index = lookup(mg)
+        state = current(index, check=True)
+        response.set_header('Vary', 'Accept-Encoding')
+        response.content_type = 'text/html; charset=utf-8'
+        encoding = accepted_encoding(request.environ.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            body = state.content
+        else:
+            response.set_header('Content-Encoding', encoding)
+            body = index.encoded(state, encoding)
+        # the page is sent one chunk at a time instead of being joined into a single body
+        response.set_header('Content-Length', str(sum(len(c) for c in body)))
+        return iter(body)
+
+    @route(prefix + '/api/pods/<namespace>/<name>/yaml')
+    def pod_yaml(namespace, name, mg=None):
+        pod = current(lookup(mg)).context.pod(namespace, name)
+        if pod is None:
+            abort(404, f'pod {namespace}/{name} not found')
+        return pod['yaml_highlight_content']
+
+    def container_log(mg, namespace, name, container):
+        '''return the ContainerLogContext of a container, or respond with 404 if it is not found'''
+        pod = current(lookup(mg)).context.pod(namespace, name)
+        if pod is None:
+            abort(404, f'pod {namespace}/{name} not found')
+        logs = [c for c in pod['containerlogs'] if c['name'] == container]
+        if len(logs) == 0:
+            abort(404, f'container {container} not found in pod {namespace}/{name}')
+        return logs[0]
+
+    @route(prefix + '/api/pods/<namespace>/<name>/logs/<container>')
+    def pod_logs(namespace, name, container, mg=None):
+        '''return a container log, the query parameters tail=N or start=N&count=N return a range of lines,
+        otherwise the whole log is returned in chunks with support for http range requests.
+        '''
+        log = container_log(mg, namespace, name, container)['log']
+
+        response.content_type = 'text/plain; charset=utf-8'
+        try:
+            if request.query.tail:
+                return log.tail(int(request.query.tail))
+            if request.query.start:
+                return log.lines(int(request.query.start), int(request.query.count or LOG_PAGE_LINES))
+        except ValueError:
+            abort(400, 'tail, start and count must be integers')
+
+        size = log.size
+        response.set_header('Accept-Ranges', 'bytes')
+        ranges = list(parse_range_header(request.environ.get('HTTP_RANGE', ''), size))
+        if ranges:
+            start, end = ranges[0]
+            response.status = 206
+            response.set_header('Content-Range', f'bytes {start}-{end - 1}/{size}')
+            return log.read(start, end)
+
+        response.set_header('Content-Length', str(size))
+        return log.blocks(0, size, LOG_CHUNK_SIZE)
+
+    @route(prefix + '/api/pods/<namespace>/<name>/logs/<container>/records')
+    def pod_log_records(namespace, name, container, mg=None):
+        '''return the klog records of a container log in time order, the query parameters start and end
+        are timestamps in the "MMDD HH:MM:SS.UUUUUU" format of the log and limit is the most records returned.
+        '''
+        containerlog = container_log(mg, namespace, name, container)
+        try:
+            start = klog.parse_timestamp(request.query.start) if request.query.start else None
+            end = klog.parse_timestamp(request.query.end) if request.query.end else None
+            limit = int(request.query.limit or KLOG_LIMIT)
+        except ValueError as ex:
+            abort(400, str(ex))
+        records = containerlog.klog
+        with profiling.phase('klog window'):
+            indices = records.window(start, end, limit=limit + 1)
+        return {
+            'total': len(records),
+            'truncated': len(indices) > limit,
+            'records': [records.record(i) for i in indices[:limit]],
+        }
+
+    @route(prefix + '/api/pods/<namespace>/<name>/logs/<container>/events')
+    def pod_log_events(namespace, name, container, mg=None):
+        '''return the autoscaler events found in a container log, in time order'''
+        return {'events': container_log(mg, namespace, name, container).klog.events}
+
+    @route(prefix + '/api/timeline')
+    def timeline(mg=None):
+        '''return the autoscaler events of all the machine api pod logs, in time order'''
+        events = []
+        for pod in current(lookup(mg)).context['mapipods']:
+            for containerlog in pod['containerlogs']:
+                source = {'namespace': pod['metadata'].get('namespace'), 'pod': pod['metadata']['name'], 'container': containerlog['name']}
+                events.extend(dict(event, **source) for event in containerlog.klog.events)
+        events.sort(key=lambda e: e['timestamp'])
+        return {'events': events}
+
+    @route(prefix + '/search')
+    def search_logs(mg=None):
+        '''search the container logs for lines containing q, limit is the most lines returned and
+        context is the number of lines before and after each match to include.
+        '''
+        query = request.query.getunicode('q', '')
+        if not query.strip():
+            abort(400, 'q is required')
+        try:
+            limit = int(request.query.limit or SEARCH_LIMIT)
+            context = int(request.query.context or 0)
+        except ValueError:
+            abort(400, 'limit and context must be integers')
+
+        index = lookup(mg)
+        state = index.state(check=False)
+        log_index = index.search_index(state)
+        with profiling.phase('search'):
+            matches = log_index.search(query, limit=limit)
+        results = []
+        for (namespace, pod, container), line, text in matches:
+            result = {'namespace': namespace, 'pod': pod, 'container': container, 'line': line, 'text': text}
+            if context > 0:
+                log = [c['log'] for c in state.context.pod(namespace, pod)['containerlogs'] if c['name'] == container][0]
+                result['before'] = log.lines(max(0, line - context), min(line, context)).splitlines()
+                result['after'] = log.lines(line + 1, context).splitlines()
+            results.append(result)
+        return {
+            'query': query,
+            'complete': log_index.complete,
+            'indexed_logs': len(log_index.logs),
+            'total_logs': log_index.total,
+            'results': results,
+        }
+
+    @route(prefix + '/api/generation')
+    def generation(mg=None):
+        '''return the generation of the context the page was last built from, as json
+
+        in watch mode the page polls this, and reloads itself when the generation is not the one it was built from.
+        '''
+        response.set_header('Cache-Control', 'no-cache')
+        return {'generation': lookup(mg).state(check=False).context['generation']}
+
+    @route(prefix + '/api/summary')
+    def summary(mg=None):
+        '''return the summary of the must gather as json'''
+        return current(lookup(mg)).context.summary()
+
+    @route(prefix + '/api/resources/<kind>/<name>/yaml')
+    def resource_yaml(kind, name, mg=None):
+        resource = current(lookup(mg)).context.resource(kind, name)
+        if resource is None:
+            abort(404, f'{kind} {name} not found')
+        return resource['yaml_highlight_content']
+
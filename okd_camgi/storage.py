@@ -0,0 +1,381 @@
+'''Storage backends that give access to the files of a must gather.
+
+All paths given to a storage are relative to its root, and use "/" as the separator.
+'''
+from copy import copy
+from io import BytesIO
+import logging
+import os
+import posixpath
+import tarfile
+from tempfile import TemporaryDirectory
+
+
+class Inventory:
+    '''index of the names, sizes and mtimes of the files at or below some paths of a directory
+
+    the paths are walked once with os.scandir when the inventory is created, so that later
+    lookups do not need to touch the filesystem, which matters when it is on a network share.
+    '''
+    def __init__(self, root, paths=('',)):
+        self.root = root
+        self.paths = tuple(paths)
+        self.files = {}
+        self.dirs = {'': set()}
+        for relpath in self.paths:
+            self._scan(relpath.strip('/'))
+
+    def covers(self, relpath):
+        '''return true if the path is at or below one of the scanned paths'''
+        relpath = relpath.strip('/')
+        return any(p == '' or relpath == p or relpath.startswith(f'{p}/') for p in self.paths)
+
+    def diff(self, previous):
+        '''return a tuple of the (added, removed, modified) paths since a previous inventory'''
+        added = sorted(self.files.keys() - previous.files.keys())
+        removed = sorted(previous.files.keys() - self.files.keys())
+        modified = sorted(p for p in self.files.keys() & previous.files.keys() if self.files[p] != previous.files[p])
+        return added, removed, modified
+
+    def rescan(self, relpaths):
+        '''return a new inventory with the files at or below relpaths scanned again, and the rest copied from this one
+
+        this is quicker than a full scan when the paths that may have changed are known.
+        '''
+        relpaths = {p.strip('/') for p in relpaths}
+        if '' in relpaths:
+            return Inventory(self.root, self.paths)
+        inventory = copy(self)
+        inventory.files = dict(self.files)
+        inventory.dirs = {name: set(entries) for name, entries in self.dirs.items()}
+        # the paths that were directories are removed with everything below them
+        prefixes = tuple(f'{p}/' for p in relpaths if p in self.dirs)
+        if prefixes:
+            inventory.files = {k: v for k, v in inventory.files.items() if not k.startswith(prefixes)}
+            inventory.dirs = {k: v for k, v in inventory.dirs.items() if not k.startswith(prefixes)}
+        for relpath in relpaths:
+            inventory.files.pop(relpath, None)
+            inventory.dirs.pop(relpath, None)
+            # parents above the scanned paths that are left empty are removed too, like a full scan would miss them
+            while relpath:
+                parent = posixpath.dirname(relpath)
+                inventory.dirs.get(parent, set()).discard(posixpath.basename(relpath))
+                if not parent or inventory.dirs.get(parent) or self.covers(parent):
+                    break
+                inventory.dirs.pop(parent, None)
+                relpath = parent
+        for relpath in sorted(relpaths):
+            # a path above the scanned paths, such as a new namespace directory, has them scanned
+            scanned = [relpath] if self.covers(relpath) else [p for p in self.paths if p.startswith(f'{relpath}/')]
+            for path in scanned:
+                try:
+                    inventory._scan(path)
+                except FileNotFoundError:
+                    # the file was removed while it was being scanned
+                    pass
+        return inventory
+
+    def add_dir(self, name):
+        '''add a directory and any missing parents to the inventory'''
+        if name not in self.dirs:
+            parent = posixpath.dirname(name)
+            self.add_dir(parent)
+            self.dirs[name] = set()
+            self.dirs[parent].add(posixpath.basename(name))
+
+    def add_file(self, name, size, mtime):
+        '''add a file and any missing parent directories to the inventory, mtime is in nanoseconds'''
+        self.add_dir(posixpath.dirname(name))
+        self.dirs[posixpath.dirname(name)].add(posixpath.basename(name))
+        self.files[name] = (size, mtime)
+
+    def walk(self, name, relpath=None):
+        '''yield a tuple of (relpath, size, mtime in nanoseconds) for every file at or below name, in sorted order
+
+        the paths yielded start with relpath in place of name, it defaults to name.
+        '''
+        relpath = name if relpath is None else relpath
+        if name in self.files:
+            yield (relpath, *self.files[name])
+            return
+        for child in sorted(self.dirs.get(name, ())):
+            yield from self.walk(posixpath.join(name, child), posixpath.join(relpath, child))
+
+    def _scan(self, relpath):
+        fullpath = os.path.join(self.root, relpath) if relpath else self.root
+        try:
+            entries = os.scandir(fullpath)
+        except NotADirectoryError:
+            stat = os.stat(fullpath)
+            self.add_file(relpath, stat.st_size, stat.st_mtime_ns)
+            return
+        except FileNotFoundError:
+            return
+        self.add_dir(relpath)
+        with entries:
+            for entry in entries:
+                entry_relpath = posixpath.join(relpath, entry.name) if relpath else entry.name
+                if entry.is_dir():
+                    self._scan(entry_relpath)
+                elif entry.is_file():
+                    stat = entry.stat()
+                    self.add_file(entry_relpath, stat.st_size, stat.st_mtime_ns)
+
+
+class DirectoryStorage:
+    '''storage for a must gather that is a directory on the local filesystem
+
+    when scan is given, the paths in it are walked once to build an Inventory, and lookups
+    of paths below them are answered from the inventory instead of the filesystem. the types
+    of the entries found by listdir are also remembered, so isdir does not need another stat.
+    '''
+    def __init__(self, root='', scan=None, inventory=None):
+        # inventory is an Inventory of the scan paths that has already been made, it is used instead of scanning them
+        self.root = root
+        self.scan = scan
+        self._inventory = inventory
+        self._isdir = {}
+
+    @property
+    def path(self):
+        return self.root
+
+    @property
+    def inventory(self):
+        '''the Inventory of the scanned paths, or none if there are no paths to scan'''
+        if self._inventory is None and self.scan is not None:
+            self._inventory = Inventory(self.root, self.scan)
+        return self._inventory
+
+    def describe(self, relpath):
+        '''return a description of the path suitable for log messages'''
+        return self._fullpath(relpath)
+
+    def exists(self, relpath):
+        inventory = self._inventory_for(relpath)
+        if inventory is not None:
+            name = relpath.strip('/')
+            return name in inventory.files or name in inventory.dirs
+        return os.path.exists(self._fullpath(relpath))
+
+    def isdir(self, relpath):
+        inventory = self._inventory_for(relpath)
+        if inventory is not None:
+            return relpath.strip('/') in inventory.dirs
+        fullpath = self._fullpath(relpath)
+        if fullpath not in self._isdir:
+            self._isdir[fullpath] = os.path.isdir(fullpath)
+        return self._isdir[fullpath]
+
+    def listdir(self, relpath):
+        inventory = self._inventory_for(relpath)
+        if inventory is not None:
+            name = relpath.strip('/')
+            if name not in inventory.dirs:
+                raise FileNotFoundError(self.describe(relpath))
+            return sorted(inventory.dirs[name])
+        fullpath = self._fullpath(relpath)
+        names = []
+        with os.scandir(fullpath) as entries:
+            for entry in entries:
+                names.append(entry.name)
+                self._isdir[os.path.join(fullpath, entry.name)] = entry.is_dir()
+        return sorted(names)
+
+    def open(self, relpath):
+        '''open a file for binary reading'''
+        return open(self._fullpath(relpath), 'rb')
+
+    def read_text(self, relpath):
+        with open(self._fullpath(relpath)) as textfile:
+            return textfile.read()
+
+    def stat(self, relpath):
+        '''return a tuple of (size, mtime in nanoseconds) for a file'''
+        inventory = self._inventory_for(relpath)
+        if inventory is not None:
+            name = relpath.strip('/')
+            if name not in inventory.files:
+                raise FileNotFoundError(self.describe(relpath))
+            return inventory.files[name]
+        stat = os.stat(self._fullpath(relpath))
+        return stat.st_size, stat.st_mtime_ns
+
+    def subtree(self, relpath):
+        '''return a storage rooted at a sub-directory of this one'''
+        return DirectoryStorage(self._fullpath(relpath))
+
+    def walk(self, relpath):
+        '''yield a tuple of (relpath, size, mtime in nanoseconds) for every file at or below a path, in sorted order'''
+        inventory = self._inventory_for(relpath)
+        if inventory is not None:
+            yield from inventory.walk(relpath.strip('/'), relpath)
+            return
+        fullpath = self._fullpath(relpath)
+        if os.path.isfile(fullpath):
+            stat = os.stat(fullpath)
+            yield relpath, stat.st_size, stat.st_mtime_ns
+            return
+        if not os.path.isdir(fullpath):
+            return
+        with os.scandir(fullpath) as entries:
+            entries = sorted(entries, key=lambda e: e.name)
+        for entry in entries:
+            entry_relpath = posixpath.join(relpath, entry.name)
+            if entry.is_dir():
+                yield from self.walk(entry_relpath)
+            elif entry.is_file():
+                stat = entry.stat()
+                yield entry_relpath, stat.st_size, stat.st_mtime_ns
+
+    def close(self):
+        pass
+
+    def _inventory_for(self, relpath):
+        # the inventory if it holds the path, otherwise none
+        if self.scan is None or not self.inventory.covers(relpath):
+            return None
+        return self._inventory
+
+    def _fullpath(self, relpath):
+        if not self.root:
+            return relpath
+        return os.path.join(self.root, relpath) if relpath else self.root
+
+
+class IndexedStorage:
+    '''base of the storages for a must gather held in a single file, such as an archive
+
+    the names, sizes and mtimes of the files are kept in an Inventory that subclasses fill when they
+    are created, so lookups do not read the file. subclasses give the open and read_text methods.
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        self.root = ''
+        self._index = Inventory(filename, paths=())
+
+    @property
+    def path(self):
+        if not self.root:
+            return self.filename
+        return os.path.join(self.filename, self.root)
+
+    def describe(self, relpath):
+        '''return a description of the path suitable for log messages'''
+        return f'{self.filename}:{self._fullpath(relpath)}'
+
+    def exists(self, relpath):
+        name = self._fullpath(relpath)
+        return name in self._index.files or name in self._index.dirs
+
+    def isdir(self, relpath):
+        return self._fullpath(relpath) in self._index.dirs
+
+    def listdir(self, relpath):
+        name = self._fullpath(relpath)
+        if name not in self._index.dirs:
+            raise FileNotFoundError(self.describe(relpath))
+        return sorted(self._index.dirs[name])
+
+    def stat(self, relpath):
+        '''return a tuple of (size, mtime in nanoseconds) for a file'''
+        name = self._fullpath(relpath)
+        if name not in self._index.files:
+            raise FileNotFoundError(self.describe(relpath))
+        return self._index.files[name]
+
+    def subtree(self, relpath):
+        '''return a storage rooted at a sub-directory of this one, sharing the same index and contents'''
+        storage = copy(self)
+        storage.root = self._fullpath(relpath)
+        return storage
+
+    def walk(self, relpath):
+        '''yield a tuple of (relpath, size, mtime in nanoseconds) for every file at or below a path, in sorted order'''
+        yield from self._index.walk(self._fullpath(relpath), relpath)
+
+    def close(self):
+        pass
+
+    def _fullpath(self, relpath):
+        relpath = relpath.strip('/')
+        if not self.root:
+            return relpath
+        return posixpath.join(self.root, relpath) if relpath else self.root
+
+
+class TarStorage(IndexedStorage):
+    '''storage for a must gather inside of a tar archive, in any compression supported by tarfile
+
+    the archive is read once, as a stream, to build an index of the member names. only the
+    members that the wanted function returns true for have their contents kept, small members
+    are held in memory and large members are extracted to a temporary directory.
+    '''
+    # members larger than this are extracted to disk instead of held in memory
+    SPOOL_THRESHOLD = 1024 * 1024
+
+    def __init__(self, archive, wanted=None):
+        super().__init__(archive)
+        self._contents = {}
+        self._extracted = None
+
+        logging.info(f'indexing mg archive {archive}')
+        with tarfile.open(archive, 'r|*') as tar:
+            for member in tar:
+                name = posixpath.normpath(member.name.lstrip('/'))
+                if name in ('.', ''):
+                    continue
+                # the archive is not trusted, members outside of its root would be extracted outside the temporary directory
+                if name == '..' or name.startswith('../'):
+                    logging.warning(f'skipping {member.name} in {archive}, it is outside of the archive root')
+                    continue
+                if member.isdir():
+                    self._index.add_dir(name)
+                    continue
+                # links are skipped along with the other special files, only the contents of regular files are read
+                if not member.isfile():
+                    continue
+                self._index.add_file(name, member.size, int(member.mtime * 10**9))
+                if wanted is not None and not wanted(name):
+                    continue
+                memberfile = tar.extractfile(member)
+                if member.size <= self.SPOOL_THRESHOLD:
+                    self._contents[name] = memberfile.read()
+                else:
+                    if self._extracted is None:
+                        self._extracted = TemporaryDirectory(prefix='okd_camgi')
+                    extracted_path = os.path.join(self._extracted.name, *name.split('/'))
+                    if os.path.commonpath([os.path.realpath(extracted_path), os.path.realpath(self._extracted.name)]) != os.path.realpath(self._extracted.name):
+                        logging.warning(f'skipping {member.name} in {archive}, it would be extracted outside of {self._extracted.name}')
+                        continue
+                    os.makedirs(os.path.dirname(extracted_path), exist_ok=True)
+                    with open(extracted_path, 'wb') as extracted:
+                        while chunk := memberfile.read(self.SPOOL_THRESHOLD):
+                            extracted.write(chunk)
+                    self._contents[name] = extracted_path
+        logging.info(f'indexed {len(self._index.files)} files, kept {len(self._contents)} from {archive}')
+
+    def open(self, relpath):
+        '''open a file for binary reading'''
+        content = self._content(relpath)
+        if isinstance(content, bytes):
+            return BytesIO(content)
+        return open(content, 'rb')
+
+    def read_text(self, relpath):
+        with self.open(relpath) as textfile:
+            return textfile.read().decode('utf-8')
+
+    def close(self):
+        if self._extracted is not None:
+            self._extracted.cleanup()
+            self._extracted = None
+
+    def _content(self, relpath):
+        name = self._fullpath(relpath)
+        if name not in self._index.files:
+            raise FileNotFoundError(self.describe(relpath))
+        if name not in self._contents:
+            raise FileNotFoundError(f'{self.describe(relpath)} was not kept when indexing the archive')
+        return self._contents[name]
+
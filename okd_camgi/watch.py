@@ -0,0 +1,212 @@
+'''Watching a must gather directory for changes, with inotify where it is available and polling otherwise.'''
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import posixpath
+import select
+import struct
+import time
+
+from okd_camgi import profiling
+from okd_camgi.storage import Inventory
+
+
+# inotify event flags, from linux/inotify.h
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+# the fixed part of an inotify event, the watch descriptor, mask, cookie and length of the name
+EVENT = struct.Struct('iIII')
+READ_SIZE = 64 * 1024
+
+# changes are collected until there have been none for this long, so that a file written in
+# several steps, or a directory being copied, is handled as one change
+SETTLE_SECONDS = 0.1
+# changes are handled after this long even if they are still being made
+MAX_SETTLE_SECONDS = 5.0
+# how often the polling watcher scans the directory
+POLL_SECONDS = 1.0
+
+
+def relevant(relpath, paths):
+    '''return true if a path is at or below one of paths, or is a directory above one of them'''
+    return any(p == '' or relpath == '' or relpath == p or relpath.startswith(f'{p}/') or p.startswith(f'{relpath}/') for p in paths)
+
+
+class InotifyWatcher:
+    '''watches the directories at or below some paths of a root directory with inotify
+
+    the directories above the paths are watched as well, so that the paths are found when they are created.
+    '''
+    def __init__(self, root, paths=('',)):
+        self.root = root
+        self.paths = tuple(p.strip('/') for p in paths)
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        # the relpath of the directory of each watch descriptor
+        self._watches = {}
+        try:
+            for relpath in self._watched_dirs():
+                self._watch(relpath)
+        except OSError:
+            self.close()
+            raise
+
+    def wait(self):
+        '''wait for changes, and return the set of paths that may have changed once they have settled
+
+        the paths are relative to the root, directories that were created, moved or removed are
+        returned instead of the files below them.
+        '''
+        changed = set()
+        first = None
+        while True:
+            if first is None:
+                timeout = None
+            else:
+                timeout = min(SETTLE_SECONDS, first + MAX_SETTLE_SECONDS - time.monotonic())
+                if timeout <= 0:
+                    return changed
+            readable, _, _ = select.select([self._fd], [], [], timeout)
+            if not readable:
+                if changed:
+                    return changed
+                # the events were for paths that are not watched, wait for the next
+                first = None
+                continue
+            self._read(changed)
+            if first is None:
+                first = time.monotonic()
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _read(self, changed):
+        try:
+            data = os.read(self._fd, READ_SIZE)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, offset)
+            name = data[offset + EVENT.size:offset + EVENT.size + length].rstrip(b'\0').decode('utf-8', errors='replace')
+            offset += EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                # events were lost, everything is scanned again
+                logging.info('inotify queue overflowed, scanning the must-gather again')
+                changed.add('')
+                continue
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            directory = self._watches.get(wd)
+            if directory is None:
+                continue
+            relpath = posixpath.join(directory, name) if directory and name else directory or name
+            if not relevant(relpath, self.paths):
+                continue
+            changed.add(relpath)
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                # new directories are watched, anything created in them before then is found by the scan of relpath
+                for new in self._watched_dirs(relpath):
+                    try:
+                        self._watch(new)
+                    except OSError as ex:
+                        logging.error(f'unable to watch {new}, {str(ex)}')
+
+    def _watch(self, relpath):
+        fullpath = os.path.join(self.root, relpath) if relpath else self.root
+        wd = self._add_watch(self._fd, os.fsencode(fullpath), WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error in (errno.ENOENT, errno.ENOTDIR):
+                # the directory was removed before it could be watched
+                return
+            raise OSError(error, f'unable to watch {fullpath}, {os.strerror(error)}')
+        self._watches[wd] = relpath
+
+    def _watched_dirs(self, start=''):
+        # yield the relpaths of the directories at or below start that are relevant to the paths
+        fullpath = os.path.join(self.root, start) if start else self.root
+        if not os.path.isdir(fullpath) or not relevant(start, self.paths):
+            return
+        yield start
+        with os.scandir(fullpath) as entries:
+            dirs = [e.name for e in entries if e.is_dir(follow_symlinks=False)]
+        for name in dirs:
+            yield from self._watched_dirs(posixpath.join(start, name) if start else name)
+
+
+class PollingWatcher:
+    '''watches some paths of a root directory by scanning them into an Inventory every POLL_SECONDS'''
+    def __init__(self, root, paths=('',)):
+        self.root = root
+        self.paths = tuple(paths)
+        self._inventory = Inventory(root, self.paths)
+
+    def wait(self):
+        '''wait for changes, and return the set of paths that changed once they have settled'''
+        changed = set()
+        first = None
+        while True:
+            time.sleep(POLL_SECONDS)
+            current = Inventory(self.root, self.paths)
+            added, removed, modified = current.diff(self._inventory)
+            self._inventory = current
+            if added or removed or modified:
+                changed.update(added, removed, modified)
+                first = first or time.monotonic()
+                if time.monotonic() - first < MAX_SETTLE_SECONDS:
+                    continue
+            if changed:
+                return changed
+
+    def close(self):
+        pass
+
+
+def open_watcher(root, paths=('',)):
+    '''return an InotifyWatcher for some paths of a root directory, or a PollingWatcher where inotify can not be used'''
+    try:
+        return InotifyWatcher(root, paths)
+    except (AttributeError, OSError) as ex:
+        # inotify is only on linux, and the number of watches is limited
+        logging.info(f'watching {root} by polling, inotify is not available, {str(ex)}')
+        return PollingWatcher(root, paths)
+
+
+def watch_changes(watcher, inventory):
+    '''yield a tuple of (inventory, changed paths) each time the files watched by a watcher change
+
+    inventory is the Inventory that the first changes are relative to. the changed paths are
+    the files that were added, removed or modified, relative to the root.
+    '''
+    while True:
+        paths = watcher.wait()
+        with profiling.phase('rescan'):
+            current = inventory.rescan(paths)
+        added, removed, modified = current.diff(inventory)
+        inventory = current
+        changed = added + removed + modified
+        if changed:
+            logging.info(f'{inventory.root} changed, {len(added)} files added, {len(removed)} removed, {len(modified)} modified')
+            yield inventory, changed
@@ -11,7 +11,6 @@ dependencies = [
     'bottle',
     'cryptography>=35.0.0',
     'jinja2',
-    'kubernetes',
     'python-dateutil',
     'pygments',
     'pyyaml',
@@ -30,6 +29,9 @@ setup(
     url="https://github.com/elmiko/okd-camgi",
     packages=['okd_camgi'],
     install_requires=dependencies,
+    extras_require={
+        'server': ['brotli', 'waitress'],
+    },
     package_data={
         'okd_camgi': ["templates/*.html"],
     },